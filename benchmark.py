@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+# Measures copy, monitor poll, hierarchy, tree report and cancel against the in-process
+# fake Drive (fake_drive.py). Prints API call counts, HTTP round trips,
+# wall time and peak Python memory for each operation and tree size.
+#
+#   python benchmark.py --sizes 1000 10000 100000 --latency 0.01
+
+def _measure(fake, func):
+    calls_before = sum(fake.calls.values()) - fake.calls["batch"]
+    http_before = fake.http_requests
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    try:
+        func()
+    except Exception as e:
+        error = e
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"api_calls": sum(fake.calls.values()) - fake.calls["batch"] - calls_before,
+            "http_requests": fake.http_requests - http_before,
+            "seconds": elapsed, "peak_mb": peak / (1024 * 1024), "error": error}
+
+def run_size(size: int, args) -> list:
+    import fake_drive
+    import state_store
+    from drive_service import get_file_hierarchy
+    from copy_engine import copy_tree
+    from monitor import check_monitor_tasks
+    from rollback import rollback_task
+    from tree_report import build_tree_index
+
+    fake = fake_drive.FakeDriveService(latency=args.latency, max_page_size=args.page_size,
+                                       error_rate=args.error_rate)
+    fake_drive.install(fake)
+    source_id = fake.add_folder("bench_source")
+    dest_id = fake.add_folder("bench_dest")
+    fake.generate_tree(source_id, size)
+    results = []
+
+    task = {"copied_files": {}, "source_folders": {}}
+    token = fake._changes_start()["startPageToken"]
+    results.append(("copy", _measure(fake, lambda: copy_tree(
+        source_id, dest_id, task["copied_files"], max_workers=args.workers,
+        source_folders=task["source_folders"]))))
+
+    state_store.clear_monitor_tasks()
+    state_store.add_monitor_task(source_id, dest_id, task["copied_files"],
+                                 {"start_page_token": token, "source_folders": task["source_folders"]})
+    # First poll absorbs the changes made by the copy itself
+    check_monitor_tasks(lambda message: None)
+    new_files = max(1, size // 100)
+    for i in range(new_files):
+        fake.add_file(f"new_{i}.txt", source_id, content=f"new {i}")
+    results.append((f"monitor-poll (+{new_files})", _measure(fake, lambda: check_monitor_tasks(lambda message: None))))
+    results.append(("monitor-poll (idle)", _measure(fake, lambda: check_monitor_tasks(lambda message: None))))
+
+    deepest = max(task["copied_files"].items(), key=lambda kv: kv[0].count("/"))[1]["id"]
+    results.append(("hierarchy", _measure(fake, lambda: get_file_hierarchy(deepest))))
+    results.append(("tree-report", _measure(fake, lambda: build_tree_index(source_id))))
+
+    task_id = state_store.get_monitor_tasks()[0]["id"]
+    results.append(("cancel", _measure(fake, lambda: rollback_task(task_id))))
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark against the fake Drive backend")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per HTTP round trip")
+    parser.add_argument("--page-size", type=int, default=1000, help="maximum page size of the fake")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 403 quota")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="client rate limit in calls/s (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    # State goes to a throwaway database in a temporary directory
+    workdir = tempfile.mkdtemp(prefix="drive_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from rate_limiter import drive_limiter
+    rate = args.rate or 1e9
+    drive_limiter.rate = drive_limiter.max_rate = rate
+    drive_limiter.capacity = drive_limiter.tokens = max(rate, 1)
+
+    print(f"{'items':>8}  {'operation':<24}{'api calls':>10}{'http':>8}{'seconds':>10}{'peak MB':>10}")
+    for size in args.sizes:
+        for name, result in run_size(size, args):
+            line = (f"{size:>8}  {name:<24}{result['api_calls']:>10}{result['http_requests']:>8}"
+                    f"{result['seconds']:>10.2f}{result['peak_mb']:>10.1f}")
+            if result["error"]:
+                line += f"  error: {result['error']}"
+            print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
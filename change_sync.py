@@ -0,0 +1,192 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from drive_service import (
+    get_start_page_token, list_changes, batch_copy_files, batch_delete_files, ensure_folder, move_file
+)
+from copy_engine import copy_tree, item_signature, content_changed, folder_entry, FOLDER_MIME
+from copied_map import CopiedMap
+from state_store import FolderMap
+from config import DELTA_SYNC, COPY_WORKERS, BATCH_LIMIT
+
+def full_sync(task: dict, log_callback=None, snapshot=None) -> None:
+    # Walks the whole source tree once and records the change feed position
+    # taken before the walk, so nothing created during it is missed. The
+    # folders are tracked like loaded ones, so once this first save has
+    # written them all, later saves only write the folders that changed.
+    token = get_start_page_token()
+    source_folders = FolderMap()
+    copy_tree(task["source_folder_id"], task["dest_folder_id"], task.setdefault("copied_files", {}),
+              log_callback=log_callback, source_folders=source_folders,
+              lister=snapshot.list_folder if snapshot else None, created=task.get("created"))
+    task["source_folders"] = source_folders
+    task["start_page_token"] = token
+
+def _dest_parent(task: dict, path: str) -> str:
+    # Destination folder ID holding the object at path, or None if unknown
+    parent_path = path.rpartition("/")[0]
+    if not parent_path:
+        return task["dest_folder_id"]
+    parent_entry = task["copied_files"].get(parent_path)
+    return parent_entry["id"] if parent_entry else None
+
+def _record_created(task: dict, obj_id: str) -> None:
+    created = task.get("created")
+    if created is not None:
+        created.append(obj_id)
+
+def _rekey(task: dict, old_path: str, new_path: str) -> None:
+    # Moves the entry at old_path, and everything below it, to new_path;
+    # only the moved subtree is visited
+    source_folders = task["source_folders"]
+    for path, moved_path in task["copied_files"].move(old_path, new_path):
+        folder_id = source_folders.by_path.get(path)
+        if folder_id is not None:
+            source_folders[folder_id] = moved_path
+
+def _flush_copies(task: dict, copies: dict, log_callback=None) -> None:
+    # Copies the files queued by _copy_changed_item, path -> (item, dest_parent_id,
+    # outdated entry or None), in batch requests sent in parallel, then removes
+    # the outdated copies of changed files
+    if not copies:
+        return
+    queued = list(copies.items())
+    copies.clear()
+    chunks = [queued[i:i + BATCH_LIMIT] for i in range(0, len(queued), BATCH_LIMIT)]
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        results = [result for chunk_results in pool.map(
+            lambda chunk: batch_copy_files([(item["id"], item.get("name", ""), parent)
+                                            for _, (item, parent, _) in chunk]), chunks)
+                   for result in chunk_results]
+    copied_map = task["copied_files"]
+    errors = []
+    outdated = []
+    for (path, (item, _, entry)), (new_file, error) in zip(queued, results):
+        name = item.get("name", "")
+        new_id = (new_file or {}).get("id")
+        if error is None and not new_id:
+            error = Exception(f"No ID returned for file {name}")
+        if error is not None:
+            errors.append(error)
+            continue
+        copied_map[path] = dict({"id": new_id, "name": name}, **item_signature(item))
+        _record_created(task, new_id)
+        if entry is not None:
+            outdated.append((path, entry["id"]))
+    if outdated:
+        # Content changed: the new copies replace the outdated ones
+        for (path, _), error in zip(outdated, batch_delete_files([old_id for _, old_id in outdated])):
+            if log_callback:
+                log_callback(f"[Monitor] File updated: '{path}'" if error is None else
+                             f"[Monitor] Could not remove outdated copy of '{path}': {error}")
+    if errors:
+        raise Exception(f"{len(errors)} copy operation(s) failed; first error: {errors[0]}")
+
+def _move_copy(task: dict, item: dict, path: str, dest_parent_id: str, copies: dict, log_callback=None) -> bool:
+    # Moves the existing copy of a renamed or moved source object to path
+    # instead of copying it again; returns False if there is no such copy.
+    # Folders are recognised by source_folders, files by their source file ID.
+    copied_map = task["copied_files"]
+    folder = item.get("mimeType") == FOLDER_MIME
+    old_path = task["source_folders"].get(item["id"]) if folder else copied_map.find_source(item["id"])
+    if old_path is None or old_path == path or old_path not in copied_map:
+        return False
+    # Queued copies go first, so their paths are rekeyed along with the move
+    _flush_copies(task, copies, log_callback)
+    name = item.get("name", "")
+    move_file(copied_map[old_path]["id"], name, dest_parent_id, _dest_parent(task, old_path))
+    _rekey(task, old_path, path)
+    copied_map[path] = dict(copied_map[path], name=name)
+    if log_callback:
+        log_callback(f"[Monitor] {'Folder' if folder else 'File'} moved: '{old_path}' -> '{path}'")
+    return True
+
+def _copy_changed_item(task: dict, item: dict, parent_path: str, copies: dict, log_callback=None,
+                       snapshot=None) -> None:
+    # Folders are handled right away; files to copy are queued in copies
+    # for _flush_copies
+    copied_map = task["copied_files"]
+    source_folders = task["source_folders"]
+    name = item.get("name", "")
+    path = f"{parent_path}/{name}" if parent_path else name
+    dest_parent_id = _dest_parent(task, path)
+    if dest_parent_id is None:
+        return
+
+    if item.get("mimeType") == FOLDER_MIME:
+        if DELTA_SYNC and _move_copy(task, item, path, dest_parent_id, copies, log_callback):
+            return
+        source_folders[item["id"]] = path
+        if path not in copied_map:
+            new_folder_id, made = ensure_folder(name, dest_parent_id)
+            copied_map[path] = folder_entry(new_folder_id, name, made)
+            if made:
+                _record_created(task, new_folder_id)
+            # Pick up anything already inside the new folder; objects moved
+            # in from elsewhere in the tree are moved rather than copied
+            relocate = None
+            if DELTA_SYNC:
+                def relocate(child, child_path, dest_id):
+                    return _move_copy(task, child, child_path, dest_id, copies, log_callback)
+            copy_tree(item["id"], new_folder_id, copied_map, log_callback=log_callback,
+                      base_path=path, source_folders=source_folders,
+                      lister=snapshot.list_folder if snapshot else None, relocate=relocate,
+                      created=task.get("created"))
+        return
+
+    entry = copied_map.get(path)
+    # Renamed or moved file: move the copy, then fall through to the content check
+    if entry is None and DELTA_SYNC and _move_copy(task, item, path, dest_parent_id, copies, log_callback):
+        entry = copied_map[path]
+    if entry is not None:
+        if not DELTA_SYNC:
+            return
+        if not content_changed(entry, item):
+            if not entry.get("source_id"):
+                copied_map[path] = dict(entry, **item_signature(item))
+            return
+    # A later change for the same path replaces the queued one
+    copies[path] = (item, dest_parent_id, entry)
+
+def sync_task(task: dict, log_callback=None, snapshot=None) -> None:
+    # Copies new items of a monitor task using the Drive changes feed.
+    # The task dict is updated in place; the stored token only advances
+    # once every relevant change has been applied. snapshot, if given, is a
+    # monitor.SourceSnapshot shared with the other tasks of the same source.
+    # If the task has a "created" list, the IDs of the objects created are
+    # appended to it.
+    if not isinstance(task.get("copied_files"), CopiedMap):
+        task["copied_files"] = CopiedMap(task.get("copied_files"))
+    if not task.get("start_page_token") or "source_folders" not in task:
+        full_sync(task, log_callback, snapshot)
+        return
+    if snapshot is not None:
+        changes, new_token = snapshot.list_changes(task["start_page_token"])
+    else:
+        changes, new_token = list_changes(task["start_page_token"])
+    pending = []
+    for change in changes:
+        item = change.get("file")
+        if change.get("removed") or not item or item.get("trashed"):
+            continue
+        pending.append(item)
+
+    # Items outside the monitored subtree never find a known parent; a new
+    # subfolder's children may be listed before the folder itself, so loop
+    # until no more items can be placed
+    source_folders = task["source_folders"]
+    copies = {}
+    progress = True
+    while pending and progress:
+        progress = False
+        remaining = []
+        for item in pending:
+            parent_id = next((p for p in item.get("parents", []) if p in source_folders), None)
+            if parent_id is None:
+                remaining.append(item)
+                continue
+            progress = True
+            _copy_changed_item(task, item, source_folders[parent_id], copies, log_callback, snapshot)
+        pending = remaining
+    _flush_copies(task, copies, log_callback)
+    if new_token:
+        task["start_page_token"] = new_token
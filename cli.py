@@ -0,0 +1,268 @@
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+# Drive modules are imported inside the commands so that startup (and
+# --help) stays fast; nothing here imports tkinter.
+
+logger = logging.getLogger("drive_manager")
+
+def _folder_id(value: str) -> str:
+    from drive_service import extract_folder_id
+    return extract_folder_id(value) or value
+
+def _file_id(value: str) -> str:
+    from drive_service import extract_file_id
+    return extract_file_id(value) or _folder_id(value)
+
+def _dest_id(value: str) -> str:
+    from config import GOOGLE_ROOT_ID
+    return _folder_id(value) if value else GOOGLE_ROOT_ID
+
+def _stop_on_signal(stop_event: threading.Event):
+    # The first SIGINT/SIGTERM sets stop_event; a second Ctrl-C interrupts right away
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping after the current batches (Ctrl-C again to abort)...")
+        stop_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+def _run_stoppable(work):
+    # Runs work(stop_event) on a daemon thread, so that a signal stops it
+    # after its current batches with its progress saved for 'resume', and a
+    # second Ctrl-C doesn't wait for it. Returns work's result.
+    stop_event = threading.Event()
+    _stop_on_signal(stop_event)
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = work(stop_event)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+def _copy(kind: str, args):
+    from copy_jobs import start_copy_job
+    source_id, dest_id = _folder_id(args.source), _dest_id(args.dest)
+    try:
+        _run_stoppable(lambda stop_event: start_copy_job(kind, source_id, dest_id, log_callback=logger.info,
+                                                         stop_event=stop_event))
+    except KeyboardInterrupt:
+        logger.info("Copy aborted; run 'resume' to continue it.")
+        return 1
+
+def cmd_copy(args):
+    return _copy("copy", args)
+
+def cmd_add_monitor(args):
+    return _copy("monitor", args)
+
+def cmd_remove_monitor(args):
+    from state_store import remove_monitor_task
+    source_id, dest_id = _folder_id(args.source), _dest_id(args.dest)
+    if remove_monitor_task(source_id, dest_id):
+        logger.info(f"Monitor task removed: {source_id} -> {dest_id}")
+    else:
+        logger.info("No monitor task found with the given paths.")
+        return 1
+
+def cmd_list_monitors(args):
+    from state_store import get_monitor_tasks
+    for task in get_monitor_tasks():
+        print(f"{task['source_folder_id']}\t{task['dest_folder_id']}\t{task['copied_count']}\t"
+              f"{task['poll_interval'] or '-'}\t{task['priority']}")
+
+def cmd_resume(args):
+    from copy_jobs import resume_copy_jobs
+    from rollback import resume_rollbacks
+    if not resume_copy_jobs(logger.info) + resume_rollbacks(logger.info):
+        logger.info("No unfinished copy jobs or rollbacks.")
+
+def cmd_rollback(args):
+    from rollback import rollback_tasks
+    from state_store import get_monitor_tasks
+    tasks = get_monitor_tasks()
+    if not args.all:
+        if not args.source:
+            logger.error("Give a source folder or --all")
+            return 1
+        source_id, dest_id = _folder_id(args.source), _dest_id(args.dest)
+        tasks = [t for t in tasks if t["source_folder_id"] == source_id and t["dest_folder_id"] == dest_id]
+    if not tasks:
+        logger.info("No monitor task found with the given paths.")
+        return 1
+    left = rollback_tasks([t["id"] for t in tasks], logger.info)
+    if left:
+        logger.error(f"Rollback incomplete: {left} copied objects remain; run 'resume' to retry")
+        return 1
+
+def cmd_sync(args):
+    from monitor import check_monitor_tasks
+    copied = check_monitor_tasks(logger.info, max_workers=args.workers)
+    logger.info(f"Monitor cycle finished. New objects copied: {copied}")
+
+def cmd_schedule(args):
+    from state_store import set_monitor_schedule
+    source_id, dest_id = _folder_id(args.source), _dest_id(args.dest)
+    if set_monitor_schedule(source_id, dest_id, args.interval, args.priority):
+        logger.info(f"Monitor schedule updated: {source_id} -> {dest_id}")
+    else:
+        logger.info("No monitor task found with the given paths.")
+        return 1
+
+def cmd_daemon(args):
+    from copy_jobs import resume_copy_jobs
+    from rollback import resume_rollbacks
+    from monitor import MonitorScheduler
+    from metrics import export_metrics
+
+    stop_event = threading.Event()
+
+    def run():
+        # Unfinished jobs are checkpointed, so the resume can stop part way
+        resume_copy_jobs(logger.info, stop_event)
+        resume_rollbacks(logger.info, stop_event)
+        scheduler.run(stop_event)
+
+    _stop_on_signal(stop_event)
+    logger.info(f"Monitor daemon started (interval {args.interval}s, {args.workers} workers)")
+    scheduler = MonitorScheduler(logger.info, max_workers=args.workers, default_interval=args.interval)
+    # Daemon thread, so an aborted daemon doesn't wait for it
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    # Metrics are exported periodically while the scheduler runs the tasks
+    try:
+        while not stop_event.wait(args.interval):
+            export_metrics()
+        thread.join()
+    except KeyboardInterrupt:
+        logger.info("Monitor daemon aborted.")
+        return 1
+    export_metrics()
+    logger.info("Monitor daemon stopped.")
+
+def cmd_hierarchy(args):
+    from drive_service import get_file_hierarchy
+    print(get_file_hierarchy(_file_id(args.url)))
+
+def cmd_tree_report(args):
+    from tree_report import build_tree_index, export_tree_report, format_tree_summary
+    index = build_tree_index(_folder_id(args.folder), log_callback=logger.info)
+    print(format_tree_summary(index))
+    if args.output:
+        logger.info(f"Tree report written to {export_tree_report(index, args.output)}")
+
+def cmd_set_permission(args):
+    from drive_service import set_file_permission
+    from state_store import add_change_record
+    file_id = _file_id(args.url)
+    perm_id = set_file_permission(file_id, args.email, args.role)
+    add_change_record("setpermissions", "(unknown)", file_id, comment=f"Permissions {args.role} for {args.email}")
+    logger.info(f"Permissions set successfully. Permission ID: {perm_id}")
+
+def cmd_share(args):
+    from sharing import share_objects, summarize_results
+    from state_store import add_change_record
+    grants = []
+    for grant in args.grant:
+        email, _, role = grant.rpartition(":")
+        if not email or role not in ("reader", "commenter", "writer", "owner"):
+            logger.error(f"Invalid grant '{grant}', expected email:role")
+            return 1
+        grants.append((email, role))
+    file_ids = [_file_id(url) for url in args.urls]
+    results = share_objects(file_ids, grants, recursive=args.recursive, log_callback=logger.info)
+    for result in results:
+        print(f"{result['status']}\t{result['id']}\t{result['email']}\t{result['role']}\t{result['path']}"
+              + (f"\t{result['error']}" if result["error"] else ""))
+    summary = summarize_results(results)
+    add_change_record("setpermissions", "(multiple objects)", "(multiple)",
+                      comment=f"Shared with {', '.join(g[0] for g in grants)}: {summary['created']} created, "
+                              f"{summary['present']} already present, {summary['error']} failed")
+    logger.info(f"Sharing finished: {summary['created']} created, {summary['present']} already present, "
+                f"{summary['error']} failed")
+    return 1 if summary["error"] else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    from config import MONITOR_INTERVAL, MONITOR_WORKERS
+    parser = argparse.ArgumentParser(description="Google Drive Manager (headless)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, func, help_text in (("copy", cmd_copy, "recursive copy; creates a monitor task"),
+                                  ("add-monitor", cmd_add_monitor, "initial copy and new monitor task"),
+                                  ("remove-monitor", cmd_remove_monitor, "remove a monitor task")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("source", help="source folder URL or ID")
+        p.add_argument("dest", nargs="?", default="", help="destination folder URL or ID (default: root)")
+        p.set_defaults(func=func)
+
+    sub.add_parser("list-monitors", help="list monitor tasks").set_defaults(func=cmd_list_monitors)
+    sub.add_parser("resume", help="resume unfinished copy jobs and rollbacks").set_defaults(func=cmd_resume)
+
+    p = sub.add_parser("rollback", help="delete the copied objects of a monitor task and remove it")
+    p.add_argument("source", nargs="?", help="source folder URL or ID")
+    p.add_argument("dest", nargs="?", default="", help="destination folder URL or ID (default: root)")
+    p.add_argument("--all", action="store_true", help="roll back every monitor task")
+    p.set_defaults(func=cmd_rollback)
+
+    for name, func, help_text in (("sync", cmd_sync, "run one monitor cycle and exit"),
+                                  ("daemon", cmd_daemon, "schedule monitor tasks until SIGINT/SIGTERM")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--workers", type=int, default=MONITOR_WORKERS, help="tasks synced concurrently")
+        if name == "daemon":
+            p.add_argument("--interval", type=float, default=MONITOR_INTERVAL,
+                           help="default seconds between polls of a task")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("schedule", help="set the polling interval and priority of a monitor task")
+    p.add_argument("source", help="source folder URL or ID")
+    p.add_argument("dest", nargs="?", default="", help="destination folder URL or ID (default: root)")
+    p.add_argument("--interval", type=float, default=None, help="seconds between polls (default: daemon interval)")
+    p.add_argument("--priority", type=int, default=0, help="higher priority tasks are polled first")
+    p.set_defaults(func=cmd_schedule)
+
+    p = sub.add_parser("hierarchy", help="print the hierarchy of a file or folder")
+    p.add_argument("url", help="file/folder URL or ID")
+    p.set_defaults(func=cmd_hierarchy)
+
+    p = sub.add_parser("tree-report", help="sizes and counts of a whole folder tree")
+    p.add_argument("folder", help="folder URL or ID")
+    p.add_argument("--output", help="write the report to a .csv or .json file")
+    p.set_defaults(func=cmd_tree_report)
+
+    p = sub.add_parser("set-permission", help="grant a user access to a file or folder")
+    p.add_argument("url", help="file/folder URL or ID")
+    p.add_argument("email")
+    p.add_argument("role", choices=["reader", "writer", "owner"])
+    p.set_defaults(func=cmd_set_permission)
+
+    p = sub.add_parser("share", help="share files or folder trees, skipping grants already present")
+    p.add_argument("urls", nargs="+", help="file/folder URLs or IDs")
+    p.add_argument("--grant", action="append", required=True, metavar="EMAIL:ROLE",
+                   help="user and role to grant; may be repeated")
+    p.add_argument("--recursive", action="store_true", help="include everything inside the folders")
+    p.set_defaults(func=cmd_share)
+    return parser
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args) or 0
+    except Exception as e:
+        logger.error(f"{args.command} failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,3 +2,55 @@
 
 SERVICE_ACCOUNT_FILE = "credentials.json"
 GOOGLE_ROOT_ID = "root"
+HTTP_TIMEOUT = 60
+# Drive API maximum for files().list
+LIST_PAGE_SIZE = 1000
+# Concurrent workers used by the recursive copy engine
+COPY_WORKERS = 8
+# Drive API maximum number of calls per batch HTTP request
+BATCH_LIMIT = 100
+# Monitor polling: "changes" uses the Drive changes feed, "full" re-walks every source tree
+MONITOR_SYNC_MODE = "changes"
+# SQLite database holding monitor tasks, copied items and the change log
+STATE_DB_FILE = "drive_state.db"
+# Change log rotation: rows kept in the database and number of JSON-lines archives
+CHANGE_LOG_MAX_ROWS = 100000
+CHANGE_LOG_ARCHIVES = 5
+# Change records (and monitor tasks) loaded per page in the Report and Monitor windows
+REPORT_PAGE_SIZE = 500
+# GUI log: lines kept in the log widget and messages inserted per refresh
+LOG_MAX_LINES = 5000
+LOG_BATCH_LIMIT = 1000
+# Shared client-side rate limit for Drive API calls and retry policy
+API_RATE_PER_SECOND = 10
+API_BURST = 20
+API_MAX_ATTEMPTS = 6
+API_BACKOFF_MAX = 64
+# In-process folder/metadata cache: maximum entries and lifetime in seconds
+METADATA_CACHE_SIZE = 10000
+METADATA_CACHE_TTL = 300
+# Seconds between progress checkpoints of a running copy job
+CHECKPOINT_INTERVAL = 30
+# Monitor polling interval in seconds and number of tasks synced concurrently
+MONITOR_INTERVAL = 10
+MONITOR_WORKERS = 4
+# Keep loaded monitor tasks (and their copied-item maps) in memory between polls
+MONITOR_CACHE_TASKS = True
+# Scheduler backoff: idle tasks slow down by MONITOR_IDLE_BACKOFF per empty poll up to
+# MONITOR_IDLE_MAX_INTERVAL seconds; failing tasks double their delay up to MONITOR_ERROR_MAX_BACKOFF
+MONITOR_IDLE_BACKOFF = 1.5
+MONITOR_IDLE_MAX_INTERVAL = 300
+MONITOR_ERROR_MAX_BACKOFF = 900
+# Tasks of the same source due within this many seconds of each other are polled together
+MONITOR_GROUP_WINDOW = 2
+# A process syncing, rolling back or copying a task/job holds a lease on it in the
+# database for LEASE_SECONDS, renewed while it works, so the GUI and the daemon
+# never work on the same one; a rollback waiting for a lease retries every LEASE_RETRY seconds
+LEASE_SECONDS = 120
+LEASE_RETRY = 2
+# Re-copy files whose modifiedTime/md5Checksum changed and follow renames/moves
+DELTA_SYNC = True
+# Metrics snapshot written by the daemon each cycle and by the GUI Export button
+METRICS_FILE = "metrics.json"
+# Folders whose children are listed by one files.list query in tree reports
+TREE_QUERY_PARENTS = 50
@@ -0,0 +1,215 @@
+import sys
+from collections.abc import MutableMapping
+
+# Paths of copied objects share long prefixes ("Reports/2024/Q1/..."), so
+# instead of a dict of full path strings the copied items are kept in a
+# trie of path segments. Each node holds its copied object, if any, in
+# __slots__ fields; a lookup returns a fresh {"id", "name", ...} dict, so
+# callers use the same entries as before. md5 checksums are held as 16 raw
+# bytes and sizes as ints, and converted back to strings in entries.
+# A destination folder that already existed and was reused rather than
+# created carries "reused": True, so a rollback leaves it in place.
+
+ENTRY_KEYS = ("source_id", "modified", "md5", "size")
+
+class CopiedNode:
+    __slots__ = ("parent", "segment", "children", "id", "name", "reused") + ENTRY_KEYS
+
+    def __init__(self, parent, segment):
+        self.parent = parent
+        self.segment = segment
+        self.children = None
+        self.id = None
+        # None when the name equals the last path segment, which is the usual case
+        self.name = None
+        self.reused = False
+        self.source_id = self.modified = self.md5 = self.size = None
+
+    def entry(self) -> dict:
+        entry = {"id": self.id, "name": self.segment if self.name is None else self.name}
+        if self.source_id:
+            entry["source_id"] = self.source_id
+            entry["modified"] = self.modified
+            entry["md5"] = self.md5.hex() if isinstance(self.md5, bytes) else self.md5
+            entry["size"] = str(self.size) if isinstance(self.size, int) else self.size
+        if self.reused:
+            entry["reused"] = True
+        return entry
+
+    def set_entry(self, entry: dict):
+        self.id = entry["id"]
+        name = entry.get("name")
+        self.name = None if name == self.segment else name
+        self.reused = bool(entry.get("reused"))
+        self.source_id = entry.get("source_id")
+        self.modified = entry.get("modified")
+        md5 = entry.get("md5")
+        # Only values that convert back unchanged are packed
+        if md5 and len(md5) == 32 and md5 == md5.lower():
+            try:
+                md5 = bytes.fromhex(md5)
+            except ValueError:
+                pass
+        self.md5 = md5
+        size = entry.get("size")
+        self.size = int(size) if isinstance(size, str) and size.isdigit() and str(int(size)) == size else size
+
+    def path(self) -> str:
+        segments = []
+        node = self
+        while node.parent is not None:
+            segments.append(node.segment)
+            node = node.parent
+        return "/".join(reversed(segments))
+
+class CopiedMap(MutableMapping):
+    # Mapping of relative path -> copied object entry, stored as a trie.
+    # Like state_store.TrackedDict it records the paths set or removed
+    # since loading (dirty/removed) so only those rows are written back.
+    def __init__(self, entries=None):
+        self.root = CopiedNode(None, "")
+        self.count = 0
+        self.dirty = set()
+        self.removed = set()
+        # Source file ID -> node, built on the first find_source call
+        self.by_source = None
+        if entries:
+            for path, entry in entries.items():
+                self[path] = entry
+
+    def _find(self, path: str, create: bool = False):
+        node = self.root
+        for segment in path.split("/"):
+            children = node.children
+            child = children.get(segment) if children else None
+            if child is None:
+                if not create:
+                    return None
+                if children is None:
+                    children = node.children = {}
+                segment = sys.intern(segment)
+                child = children[segment] = CopiedNode(node, segment)
+            node = child
+        return node
+
+    def __getitem__(self, path: str) -> dict:
+        node = self._find(path)
+        if node is None or node.id is None:
+            raise KeyError(path)
+        return node.entry()
+
+    def __contains__(self, path) -> bool:
+        node = self._find(path)
+        return node is not None and node.id is not None
+
+    def __setitem__(self, path: str, entry: dict):
+        node = self._find(path, create=True)
+        if node.id is None:
+            self.count += 1
+        elif self.by_source is not None and node.source_id:
+            self.by_source.pop(node.source_id, None)
+        node.set_entry(entry)
+        if self.by_source is not None and node.source_id:
+            self.by_source[node.source_id] = node
+        self.dirty.add(path)
+        self.removed.discard(path)
+
+    def __delitem__(self, path: str):
+        node = self._find(path)
+        if node is None or node.id is None:
+            raise KeyError(path)
+        if self.by_source is not None and self.by_source.get(node.source_id) is node:
+            del self.by_source[node.source_id]
+        node.id = node.name = None
+        node.reused = False
+        node.source_id = node.modified = node.md5 = node.size = None
+        self.count -= 1
+        # Drop nodes that no longer lead to any copied object
+        while node.parent is not None and node.id is None and not node.children:
+            del node.parent.children[node.segment]
+            node = node.parent
+        self.dirty.discard(path)
+        self.removed.add(path)
+
+    def _walk(self, start=None, start_path: str = "", all_nodes: bool = False):
+        # Yields (path, node) for every copied object below start (the root by
+        # default), parents before children; with all_nodes also for the
+        # intermediate nodes that hold no object
+        stack = [(start_path, start or self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            folders = []
+            for segment, child in (node.children or {}).items():
+                path = f"{prefix}/{segment}" if prefix else segment
+                if all_nodes or child.id is not None:
+                    yield path, child
+                if child.children:
+                    folders.append((path, child))
+            stack.extend(reversed(folders))
+
+    def __iter__(self):
+        return (path for path, _ in self._walk())
+
+    def __len__(self) -> int:
+        return self.count
+
+    def items(self):
+        # Single pass over the trie instead of one lookup per key
+        return ((path, node.entry()) for path, node in self._walk())
+
+    def values(self):
+        return (node.entry() for _, node in self._walk())
+
+    def move(self, old_path: str, new_path: str) -> list:
+        # Moves the entry at old_path and everything below it to new_path by
+        # re-linking the subtree, so the cost depends on the subtree only.
+        # Returns the (old path, new path) of every node moved, including
+        # intermediate ones. A moved entry keeps its name.
+        node = self._find(old_path)
+        if node is None:
+            raise KeyError(old_path)
+        moved = [(old_path, node)] + list(self._walk(node, old_path, all_nodes=True))
+        pairs = [(path, new_path + path[len(old_path):]) for path, _ in moved]
+        if self._find(new_path) is not None:
+            # Something is already there: merge entry by entry
+            entries = [(new, n.entry()) for (_, new), (_, n) in zip(pairs, moved) if n.id is not None]
+            for path, n in moved:
+                if n.id is not None:
+                    del self[path]
+            for path, entry in entries:
+                self[path] = entry
+            return pairs
+        parent_path, _, segment = new_path.rpartition("/")
+        parent = self._find(parent_path, create=True) if parent_path else self.root
+        old_parent = node.parent
+        del old_parent.children[node.segment]
+        if node.id is not None and node.name is None:
+            node.name = node.segment
+        segment = sys.intern(segment)
+        if node.name == segment:
+            node.name = None
+        node.parent = parent
+        node.segment = segment
+        if parent.children is None:
+            parent.children = {}
+        parent.children[segment] = node
+        # Drop the old ancestors that no longer lead to any copied object
+        while old_parent.parent is not None and old_parent.id is None and not old_parent.children:
+            del old_parent.parent.children[old_parent.segment]
+            old_parent = old_parent.parent
+        for (old, _), (_, n) in zip(pairs, moved):
+            if n.id is not None:
+                self.dirty.discard(old)
+                self.removed.add(old)
+        for (_, new), (_, n) in zip(pairs, moved):
+            if n.id is not None:
+                self.dirty.add(new)
+                self.removed.discard(new)
+        return pairs
+
+    def find_source(self, source_id: str):
+        # Path of the copy of the given source file, or None
+        if self.by_source is None:
+            self.by_source = {node.source_id: node for _, node in self._walk() if node.source_id}
+        node = self.by_source.get(source_id)
+        return node.path() if node is not None else None
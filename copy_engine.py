@@ -0,0 +1,191 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from drive_service import iter_files_in_folder, batch_copy_files, batch_delete_files, ensure_folder, SYNC_LIST_FIELDS
+from config import COPY_WORKERS, BATCH_LIMIT, CHECKPOINT_INTERVAL, DELTA_SYNC
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+def item_signature(item: dict) -> dict:
+    # Source-side identity and content markers stored with a copied file
+    return {"source_id": item.get("id"), "modified": item.get("modifiedTime"),
+            "md5": item.get("md5Checksum"), "size": item.get("size")}
+
+def content_changed(entry: dict, item: dict) -> bool:
+    # Entries copied before signatures were recorded have no baseline
+    if not entry.get("source_id"):
+        return False
+    if entry["source_id"] != item.get("id"):
+        return True
+    # Google Docs have no md5Checksum, so fall back to modifiedTime
+    if entry.get("md5") and item.get("md5Checksum"):
+        return entry["md5"] != item["md5Checksum"] or entry.get("size") != item.get("size")
+    return entry.get("modified") != item.get("modifiedTime")
+
+def folder_entry(folder_id: str, name: str, made: bool) -> dict:
+    # Copied-map entry of a destination folder; see copied_map for "reused"
+    return {"id": folder_id, "name": name} if made else {"id": folder_id, "name": name, "reused": True}
+
+def _list_source(folder_id: str) -> list:
+    return iter_files_in_folder(folder_id, fields=SYNC_LIST_FIELDS)
+
+def _scan_folder(src_id: str, dest_id: str, base_path: str, copied_map: dict, source_folders: dict,
+                 lock: threading.Lock, delta: bool, replaced: dict, lister=_list_source, relocate=None,
+                 created: list = None):
+    # Creates the destination subfolders of one source folder and returns
+    # the subfolders to descend into plus the files still to be copied, as
+    # (file_id, name, dest_id, path, signature). With delta, files whose
+    # content changed are queued again and their old copy is recorded in replaced.
+    subfolders = []
+    files = []
+    for item in lister(src_id):
+        if not isinstance(item, dict):
+            continue
+        current_name = item.get("name", "")
+        current_id = item.get("id", "")
+        current_path = f"{base_path}/{current_name}" if base_path else current_name
+        with lock:
+            existing = copied_map.get(current_path)
+            if existing is None and relocate is not None and relocate(item, current_path, dest_id):
+                existing = copied_map.get(current_path)
+        if item.get("mimeType", "") == FOLDER_MIME:
+            if existing is None:
+                new_folder_id, made = ensure_folder(current_name, dest_id)
+                with lock:
+                    copied_map[current_path] = folder_entry(new_folder_id, current_name, made)
+                    if made and created is not None:
+                        created.append(new_folder_id)
+            else:
+                new_folder_id = existing["id"]
+            with lock:
+                source_folders[current_id] = current_path
+            subfolders.append((current_id, new_folder_id, current_path))
+        elif existing is None:
+            files.append((current_id, current_name, dest_id, current_path, item_signature(item)))
+        elif delta:
+            with lock:
+                if content_changed(existing, item):
+                    files.append((current_id, current_name, dest_id, current_path, item_signature(item)))
+                    replaced[current_path] = existing["id"]
+                elif not existing.get("source_id"):
+                    copied_map[current_path] = dict(existing, **item_signature(item))
+    return subfolders, files
+
+def _copy_batch(chunk: list) -> list:
+    # chunk: queued files as returned by _scan_folder; returns (path, name, new_id, error, signature)
+    results = batch_copy_files([(fid, name, parent) for (fid, name, parent, _, _) in chunk])
+    outcome = []
+    for (fid, name, parent, path, signature), (new_file, error) in zip(chunk, results):
+        new_id = (new_file or {}).get("id")
+        if error is None and not new_id:
+            error = Exception(f"No ID returned for file {name}")
+        outcome.append((path, name, new_id, error, signature))
+    return outcome
+
+def copy_tree(src_id: str, dest_id: str, copied_map: dict = None, max_workers: int = COPY_WORKERS,
+              log_callback=None, base_path: str = "", source_folders: dict = None,
+              pending: tuple = None, checkpoint=None, delta: bool = DELTA_SYNC, progress=None,
+              lister=None, stop_event=None, relocate=None, created: list = None) -> dict:
+    # source_folders, if given, is filled with source folder ID -> relative path.
+    # pending is a saved (folders, files) work queue to resume from instead of
+    # the source root; files carry their source signature, as from _scan_folder.
+    # checkpoint(folders, new_files) is called after every folder level with
+    # the remaining folder queue and newly found files, and as
+    # checkpoint(None, None) every CHECKPOINT_INTERVAL seconds while copying.
+    # progress, if given, is a metrics.JobProgress updated as files are copied.
+    # lister(folder_id) replaces the source listing, e.g. with a shared snapshot.
+    # stop_event, once set, ends the copy early after the current folder level
+    # or file batches; whatever was not reached stays in the checkpointed queue.
+    # relocate(item, path, dest_id) is called, under the lock, for objects with
+    # no copy at path yet; it returns True if it moved an existing copy there.
+    # created, if given, collects the IDs of the folders and files created.
+    if copied_map is None:
+        copied_map = {}
+    if source_folders is None:
+        source_folders = {}
+    source_folders[src_id] = base_path
+    lock = threading.Lock()
+    errors = []
+    replaced = {}
+    if pending is not None:
+        level = list(pending[0])
+        pending_files = [f for f in pending[1] if f[3] not in copied_map]
+    else:
+        level = [(src_id, dest_id, base_path)]
+        pending_files = []
+    if progress:
+        progress.add_total(len(pending_files))
+    # Folders whose listing failed stay in the saved queue for the next resume
+    failed_folders = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Build the folder skeleton level by level, listing folders of a level concurrently
+            while level and not (stop_event and stop_event.is_set()):
+                futures = {pool.submit(_scan_folder, s, d, p, copied_map, source_folders, lock,
+                                       delta, replaced, lister or _list_source, relocate, created): (s, d, p)
+                           for (s, d, p) in level}
+                level = []
+                new_files = []
+                for future in as_completed(futures):
+                    try:
+                        subfolders, files = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        failed_folders.append(futures[future])
+                        continue
+                    level.extend(subfolders)
+                    new_files.extend(files)
+                pending_files.extend(new_files)
+                if progress:
+                    progress.add_total(len(new_files))
+                if checkpoint:
+                    checkpoint(level + failed_folders, new_files)
+            if stop_event and stop_event.is_set():
+                pending_files = []
+            if log_callback and pending_files:
+                log_callback(f"Folder structure ready; copying {len(pending_files)} files with {max_workers} workers...")
+
+            # Fan out the file copies, one batch HTTP request per worker task
+            chunks = [pending_files[i:i + BATCH_LIMIT] for i in range(0, len(pending_files), BATCH_LIMIT)]
+            futures = [pool.submit(_copy_batch, chunk) for chunk in chunks]
+            last_checkpoint = time.monotonic()
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                if stop_event and stop_event.is_set():
+                    for pending_future in futures:
+                        pending_future.cancel()
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                with lock:
+                    for path, name, new_id, error, signature in outcome:
+                        if error is not None:
+                            errors.append(error)
+                        else:
+                            copied_map[path] = dict({"id": new_id, "name": name}, **signature)
+                            if created is not None:
+                                created.append(new_id)
+                            if progress:
+                                progress.advance(1, int(signature.get("size") or 0))
+                    if checkpoint and time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                        checkpoint(None, None)
+                        last_checkpoint = time.monotonic()
+        # Remove the outdated copies of files that were copied again
+        stale = [(path, old_id) for path, old_id in replaced.items() if copied_map[path]["id"] != old_id]
+        if stale:
+            for (path, old_id), error in zip(stale, batch_delete_files([old_id for _, old_id in stale])):
+                if error is not None and log_callback:
+                    log_callback(f"Could not remove outdated copy of '{path}': {error}")
+            if log_callback:
+                log_callback(f"Updated {len(stale)} changed files.")
+    finally:
+        if checkpoint:
+            with lock:
+                checkpoint(None, None)
+    if errors:
+        raise Exception(f"{len(errors)} copy operation(s) failed; first error: {errors[0]}")
+    return copied_map
@@ -0,0 +1,85 @@
+from drive_service import get_start_page_token
+from copy_engine import copy_tree
+from metrics import start_job
+from state_store import (
+    create_copy_job, load_copy_job, checkpoint_copy_job, delete_copy_job, get_copy_jobs,
+    add_monitor_task, get_monitor_tasks, add_change_record, take_lease, release_lease
+)
+
+# kind: "copy" (Copy command) or "monitor" (AddMonitor command)
+
+def start_copy_job(kind: str, source_id: str, dest_id: str, log_callback=None, stop_event=None) -> dict:
+    # The changes feed position is taken before the walk, as in full_sync
+    job_id = create_copy_job(kind, source_id, dest_id, get_start_page_token())
+    return run_copy_job(job_id, log_callback, stop_event)
+
+def run_copy_job(job_id: int, log_callback=None, stop_event=None) -> dict:
+    # With stop_event set part way, the job stays checkpointed for the next resume.
+    # A job already running in another process (e.g. the GUI and the daemon
+    # both resuming it) is left to that process, and None is returned.
+    if not take_lease("copy_jobs", job_id):
+        if log_callback:
+            log_callback(f"Copy job {job_id} is running in another process")
+        return None
+    try:
+        return _run_copy_job(job_id, log_callback, stop_event)
+    finally:
+        release_lease("copy_jobs", job_id)
+
+def _run_copy_job(job_id: int, log_callback, stop_event) -> dict:
+    job = load_copy_job(job_id)
+    progress = start_job(f"{job['kind']} {job['source_folder_id']} -> {job['dest_folder_id']}")
+    try:
+        copy_tree(job["source_folder_id"], job["dest_folder_id"], job["copied_files"],
+                  log_callback=log_callback, source_folders=job["source_folders"],
+                  pending=(job["pending_folders"], job["pending_files"]),
+                  checkpoint=lambda folders, new_files: checkpoint_copy_job(job, folders, new_files),
+                  progress=progress, stop_event=stop_event)
+    except Exception:
+        progress.finish("failed")
+        raise
+    if stop_event and stop_event.is_set():
+        progress.finish("stopped")
+        if log_callback:
+            log_callback(f"Copy job {job_id} stopped; it will be resumed on the next start")
+        return job
+    progress.finish()
+    _finish_copy_job(job, log_callback)
+    return job
+
+def _finish_copy_job(job: dict, log_callback=None):
+    log = log_callback or (lambda message: None)
+    source_id = job["source_folder_id"]
+    dest_id = job["dest_folder_id"]
+    copied_map = job["copied_files"]
+    sync_state = {"start_page_token": job["start_page_token"], "source_folders": job["source_folders"]}
+    if job["kind"] == "copy":
+        log(f"Copy finished. Total objects copied: {len(copied_map)}")
+        tasks = get_monitor_tasks()
+        exists = any(t["source_folder_id"] == source_id and t["dest_folder_id"] == dest_id for t in tasks)
+        if not exists:
+            add_monitor_task(source_id, dest_id, copied_map, sync_state)
+            log("Monitor task created.")
+        add_change_record("copy", "(multiple objects)", "(multiple)", source_id, dest_id, "Recursive copy via Copy")
+    else:
+        log(f"Initial copy finished. Total objects copied: {len(copied_map)}")
+        if add_monitor_task(source_id, dest_id, copied_map, sync_state):
+            log(f"New monitor task added:\nSource: {source_id}\nDestination: {dest_id}")
+        else:
+            log("Monitor task already exists!")
+    delete_copy_job(job["id"])
+
+def resume_copy_jobs(log_callback=None, stop_event=None) -> int:
+    # Continues every job left unfinished by a previous run, until stop_event is set
+    log = log_callback or (lambda message: None)
+    jobs = get_copy_jobs()
+    for job in jobs:
+        if stop_event and stop_event.is_set():
+            break
+        log(f"Resuming copy job {job['id']}: {job['source_folder_id']} -> {job['dest_folder_id']} "
+            f"({job['copied_count']} objects already copied)")
+        try:
+            run_copy_job(job["id"], log_callback, stop_event)
+        except Exception as e:
+            log(f"Copy job {job['id']} error: {e}")
+    return len(jobs)
@@ -1,21 +1,88 @@
 import re
 import os
+import time
+import threading
+import httplib2
+import google_auth_httplib2
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
-from tenacity import retry, wait_fixed, stop_after_attempt
-from config import SERVICE_ACCOUNT_FILE
+import metadata_cache
+from metrics import record_call
+from rate_limiter import api_retry, drive_limiter, is_retryable_error, backoff_delay, note_retry
+from config import SERVICE_ACCOUNT_FILE, HTTP_TIMEOUT, LIST_PAGE_SIZE, BATCH_LIMIT, API_MAX_ATTEMPTS
 
 SCOPES = ["https://www.googleapis.com/auth/drive"]
+DEFAULT_LIST_FIELDS = "id, name, mimeType"
+# Listing fields needed to detect content changes between syncs
+SYNC_LIST_FIELDS = "id, name, mimeType, modifiedTime, md5Checksum, size"
+# Listing fields for tree reports; parents tells which queried folder an item is in
+TREE_LIST_FIELDS = "id, name, mimeType, parents, size, modifiedTime"
+DEFAULT_CHANGE_FIELDS = "fileId, removed, file(id, name, mimeType, parents, trashed, modifiedTime, md5Checksum, size)"
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+# One authorized client per thread; credentials (and their token) are shared
+_local = threading.local()
+_credentials = None
+_credentials_lock = threading.Lock()
+_pool_stats = {"built": 0, "reused": 0}
+_pool_stats_lock = threading.Lock()
+
+def _get_credentials():
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            if not os.path.exists(SERVICE_ACCOUNT_FILE):
+                raise FileNotFoundError(f"Service account file not found: {SERVICE_ACCOUNT_FILE}")
+            _credentials = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+        return _credentials
+
+def _refresh_credentials(credentials, http):
+    # Refresh under the lock so threads don't race to fetch the same token
+    with _credentials_lock:
+        if not credentials.valid:
+            credentials.refresh(google_auth_httplib2.Request(http))
+
+def _count(key: str):
+    with _pool_stats_lock:
+        _pool_stats[key] += 1
+
+@api_retry
 def get_drive_service():
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
-        raise FileNotFoundError(f"Service account file not found: {SERVICE_ACCOUNT_FILE}")
-    credentials = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    service = build("drive", "v3", credentials=credentials, cache_discovery=False)
+    credentials = _get_credentials()
+    service = getattr(_local, "service", None)
+    if service is not None:
+        _refresh_credentials(credentials, _local.http)
+        _count("reused")
+        return service
+    # httplib2.Http keeps connections alive between requests
+    http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    _refresh_credentials(credentials, http)
+    authed_http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+    service = build("drive", "v3", http=authed_http, cache_discovery=False)
+    _local.http = http
+    _local.service = service
+    _count("built")
     return service
 
+def _execute(request):
+    # Every Drive call passes through the shared client-side rate limiter
+    drive_limiter.acquire()
+    operation = getattr(request, "methodId", "unknown")
+    started = time.perf_counter()
+    try:
+        result = request.execute()
+    except Exception as e:
+        record_call(operation, time.perf_counter() - started, errors=1)
+        e.operation = operation
+        raise
+    record_call(operation, time.perf_counter() - started)
+    drive_limiter.reward()
+    return result
+
+def get_pool_stats() -> dict:
+    with _pool_stats_lock:
+        return dict(_pool_stats)
+
 def extract_folder_id(url: str) -> str:
     pattern = r"/drive/(?:u/\d+/)?folders/([a-zA-Z0-9_-]+)"
     match = re.search(pattern, url)
@@ -42,38 +109,79 @@ def extract_file_id(url: str) -> str:
         return match.group(1)
     return None
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def list_files_in_folder(folder_id: str) -> list:
+@api_retry
+def _list_page(query: str, fields: str, page_size: int, page_token: str = None) -> dict:
     service = get_drive_service()
-    query = f"'{folder_id}' in parents and trashed = false"
-    results = service.files().list(
+    return _execute(service.files().list(
         q=query,
-        fields="files(id, name, mimeType)",
+        fields=f"nextPageToken, files({fields})",
+        pageSize=page_size,
+        pageToken=page_token,
         includeItemsFromAllDrives=True,
         supportsAllDrives=True
-    ).execute()
-    return results.get("files", [])
+    ))
+
+def iter_files_in_folder(folder_id: str, fields: str = DEFAULT_LIST_FIELDS, page_size: int = LIST_PAGE_SIZE):
+    # Yields items page by page so callers can start before the listing ends
+    return _iter_query(f"'{folder_id}' in parents and trashed = false", fields, page_size)
+
+def iter_children(folder_ids: list, fields: str = TREE_LIST_FIELDS, page_size: int = LIST_PAGE_SIZE):
+    # Children of several folders from one paginated query; include
+    # "parents" in fields to tell which folder each item belongs to
+    parents = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+    return _iter_query(f"({parents}) and trashed = false", fields, page_size)
+
+def _iter_query(query: str, fields: str, page_size: int):
+    page_token = None
+    while True:
+        results = _list_page(query, fields, page_size, page_token)
+        for item in results.get("files", []):
+            yield item
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+def list_files_in_folder(folder_id: str, fields: str = DEFAULT_LIST_FIELDS) -> list:
+    return list(iter_files_in_folder(folder_id, fields))
+
+@api_retry
 def copy_file(file_id: str, file_name: str, dest_folder_id: str) -> dict:
     service = get_drive_service()
     body = {"name": file_name, "parents": [dest_folder_id]}
-    new_file = service.files().copy(
+    new_file = _execute(service.files().copy(
         fileId=file_id,
         body=body,
         supportsAllDrives=True
-    ).execute()
+    ))
     return new_file
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+@api_retry
 def delete_file(file_id: str) -> None:
     service = get_drive_service()
-    service.files().delete(
+    _execute(service.files().delete(
         fileId=file_id,
         supportsAllDrives=True
-    ).execute()
+    ))
+    metadata_cache.invalidate(file_id)
+
+@api_retry
+def move_file(file_id: str, new_name: str, new_parent_id: str, old_parent_id: str) -> dict:
+    # Renames and/or moves an object in place, keeping its ID
+    service = get_drive_service()
+    kwargs = {}
+    if new_parent_id != old_parent_id:
+        kwargs = {"addParents": new_parent_id, "removeParents": old_parent_id}
+    result = _execute(service.files().update(
+        fileId=file_id,
+        body={"name": new_name},
+        fields="id, name, parents",
+        supportsAllDrives=True,
+        **kwargs
+    ))
+    metadata_cache.invalidate(file_id)
+    return result
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+@api_retry
 def set_file_permission(file_id: str, email: str, role: str) -> str:
     service = get_drive_service()
     permission_body = {
@@ -81,32 +189,153 @@ def set_file_permission(file_id: str, email: str, role: str) -> str:
         "role": role,
         "emailAddress": email
     }
-    result = service.permissions().create(
+    result = _execute(service.permissions().create(
         fileId=file_id,
         body=permission_body,
         fields="id",
         supportsAllDrives=True
-    ).execute()
+    ))
     return result.get("id")
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_file_hierarchy(file_id: str) -> str:
+@api_retry
+def get_start_page_token() -> str:
+    service = get_drive_service()
+    result = _execute(service.changes().getStartPageToken(
+        supportsAllDrives=True
+    ))
+    return result.get("startPageToken")
+
+@api_retry
+def _changes_page(page_token: str, fields: str, page_size: int) -> dict:
+    service = get_drive_service()
+    return _execute(service.changes().list(
+        pageToken=page_token,
+        fields=f"nextPageToken, newStartPageToken, changes({fields})",
+        pageSize=page_size,
+        includeItemsFromAllDrives=True,
+        supportsAllDrives=True
+    ))
+
+def list_changes(page_token: str, fields: str = DEFAULT_CHANGE_FIELDS, page_size: int = LIST_PAGE_SIZE) -> tuple:
+    # Returns all changes since page_token and the token to use on the next poll
+    changes = []
+    while True:
+        results = _changes_page(page_token, fields, page_size)
+        changes.extend(results.get("changes", []))
+        if results.get("newStartPageToken"):
+            return changes, results["newStartPageToken"]
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return changes, None
+
+def _run_batch(items: list, make_request) -> list:
+    # Sends one Drive batch HTTP request per BATCH_LIMIT items and returns
+    # a (response, error) pair for every item, in input order. Items that
+    # fail with a retryable error are re-sent with backoff.
+    results = [(None, None)] * len(items)
+    operations = [None] * len(items)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for start in range(0, len(items), BATCH_LIMIT):
+        indices = list(range(start, min(start + BATCH_LIMIT, len(items))))
+        for attempt in range(API_MAX_ATTEMPTS):
+            service = get_drive_service()
+            batch = service.new_batch_http_request(callback=callback)
+            for index in indices:
+                results[index] = (None, None)
+                request = make_request(service, items[index])
+                operations[index] = getattr(request, "methodId", "unknown")
+                batch.add(request, request_id=str(index))
+            # Drive counts each request inside a batch against the quota
+            drive_limiter.acquire(len(indices))
+            started = time.perf_counter()
+            try:
+                batch.execute()
+            except Exception as e:
+                for index in indices:
+                    if results[index] == (None, None):
+                        results[index] = (None, e)
+            # Metrics are kept per Drive method, as for single calls
+            elapsed = time.perf_counter() - started
+            by_operation = {}
+            for index in indices:
+                by_operation.setdefault(operations[index], []).append(index)
+            for operation, op_indices in by_operation.items():
+                record_call(operation, elapsed, errors=sum(results[i][1] is not None for i in op_indices),
+                            items=len(op_indices))
+            indices = [i for i in indices if results[i][1] is not None and is_retryable_error(results[i][1])]
+            if not indices or attempt == API_MAX_ATTEMPTS - 1:
+                break
+            note_retry(results[indices[0]][1], {operations[i] for i in indices})
+            time.sleep(backoff_delay(attempt))
+    return results
+
+def batch_copy_files(items: list) -> list:
+    # items: (file_id, file_name, dest_folder_id); returns (new_file, error) pairs
+    return _run_batch(items, lambda service, item: service.files().copy(
+        fileId=item[0],
+        body={"name": item[1], "parents": [item[2]]},
+        supportsAllDrives=True
+    ))
+
+def batch_delete_files(file_ids: list) -> list:
+    # Returns the error for each file ID, or None if it was deleted
+    results = _run_batch(file_ids, lambda service, file_id: service.files().delete(
+        fileId=file_id,
+        supportsAllDrives=True
+    ))
+    for file_id, (_, error) in zip(file_ids, results):
+        if error is None:
+            metadata_cache.invalidate(file_id)
+    return [error for (_, error) in results]
+
+def batch_create_permissions(items: list) -> list:
+    # items: (file_id, email, role); returns (permission_id, error) pairs
+    results = _run_batch(items, lambda service, item: service.permissions().create(
+        fileId=item[0],
+        body={"type": "user", "role": item[2], "emailAddress": item[1]},
+        fields="id",
+        sendNotificationEmail=False,
+        supportsAllDrives=True
+    ))
+    return [((response or {}).get("id"), error) for (response, error) in results]
+
+def batch_list_permissions(file_ids: list) -> list:
+    # Returns (permissions, error) pairs for each file ID; only the first
+    # 100 permissions of a file are read
+    results = _run_batch(file_ids, lambda service, file_id: service.permissions().list(
+        fileId=file_id,
+        fields="permissions(id, type, role, emailAddress)",
+        pageSize=100,
+        supportsAllDrives=True
+    ))
+    return [((response or {}).get("permissions", []), error) for (response, error) in results]
+
+@api_retry
+def _fetch_metadata(file_id: str) -> dict:
     service = get_drive_service()
-    file = service.files().get(
+    return _execute(service.files().get(
         fileId=file_id,
-        fields="id, name, parents, mimeType",
+        fields="id, name, parents, mimeType, size, modifiedTime",
         supportsAllDrives=True
-    ).execute()
+    ))
+
+def get_file_metadata(file_id: str) -> dict:
+    metadata = metadata_cache.file_metadata.get(file_id)
+    if metadata is None:
+        metadata = _fetch_metadata(file_id)
+        metadata_cache.file_metadata.put(file_id, metadata)
+    return metadata
+
+def get_file_hierarchy(file_id: str) -> str:
+    file = get_file_metadata(file_id)
     report = f"Object: {file.get('name')} (ID: {file.get('id')})\n"
     parents = file.get("parents", [])
     parent_chain = []
     while parents:
-        parent_id = parents[0]
-        parent = service.files().get(
-            fileId=parent_id,
-            fields="id, name, parents",
-            supportsAllDrives=True
-        ).execute()
+        parent = get_file_metadata(parents[0])
         parent_chain.append(f"{parent.get('name')} (ID: {parent.get('id')})")
         parents = parent.get("parents", [])
     if parent_chain:
@@ -114,35 +343,50 @@ def get_file_hierarchy(file_id: str) -> str:
     else:
         report += "No parent hierarchy.\n"
     if file.get("mimeType") == "application/vnd.google-apps.folder":
-        children = list_files_in_folder(file_id)
-        if children:
-            child_list = "\n".join([f"{c.get('name')} (ID: {c.get('id')})" for c in children])
-            report += "Child files/folders:\n" + child_list
+        child_lines = [f"{c.get('name')} (ID: {c.get('id')})"
+                       for c in iter_files_in_folder(file_id, fields="id, name")]
+        if child_lines:
+            report += "Child files/folders:\n" + "\n".join(child_lines)
         else:
             report += "No child files/folders.\n"
     return report
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
 def find_folder(name: str, parent_id: str) -> str:
+    folder_id = metadata_cache.folder_ids.get((name, parent_id))
+    if folder_id:
+        return folder_id
+    if metadata_cache.new_folders.get(parent_id):
+        return None
+    folder_id = _query_folder(name, parent_id)
+    if folder_id:
+        metadata_cache.remember_folder(name, parent_id, folder_id)
+    return folder_id
+
+@api_retry
+def _query_folder(name: str, parent_id: str) -> str:
     service = get_drive_service()
     safe_name = name.replace("'", "\\'")
     query = f"name = '{safe_name}' and '{parent_id}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    results = service.files().list(
+    results = _execute(service.files().list(
          q=query,
          fields="files(id, name)",
          includeItemsFromAllDrives=True,
          supportsAllDrives=True
-    ).execute()
+    ))
     files = results.get("files", [])
     if files:
          return files[0]["id"]
     return None
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
 def create_folder(name: str, parent_id: str) -> str:
+    return ensure_folder(name, parent_id)[0]
+
+@api_retry
+def ensure_folder(name: str, parent_id: str) -> tuple:
+    # Returns (folder_id, created); an existing folder of that name is reused
     existing_folder_id = find_folder(name, parent_id)
     if existing_folder_id:
-        return existing_folder_id
+        return existing_folder_id, False
     service = get_drive_service()
     metadata = {
         "name": name,
@@ -150,19 +394,20 @@ def create_folder(name: str, parent_id: str) -> str:
         "mimeType": "application/vnd.google-apps.folder"
     }
     try:
-        folder = service.files().create(
+        folder = _execute(service.files().create(
             body=metadata,
             fields="id",
             supportsAllDrives=True
-        ).execute()
+        ))
     except Exception as e:
-        print("Folder creation error:", e)
+        if is_retryable_error(e):
+            raise
         raise Exception(f"Error creating folder {name}: {e}")
-    return folder.get("id")
+    metadata_cache.remember_folder(name, parent_id, folder.get("id"), created=True)
+    return folder.get("id"), True
 
 def copy_new_items(src_id: str, dest_id: str, copied_map: dict, base_path="") -> dict:
-    items = list_files_in_folder(src_id)
-    for item in items:
+    for item in iter_files_in_folder(src_id):
         if not isinstance(item, dict):
             continue
         current_name = item.get("name", "")
@@ -0,0 +1,317 @@
+import re
+import json
+import time
+import random
+import hashlib
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# In-process stand-in for the object returned by get_drive_service(), covering
+# the files(), permissions() and changes() calls and batch requests used by
+# this project. Used by benchmark.py; no network access or credentials needed.
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+_PARENT_RE = re.compile(r"'((?:[^'\\]|\\.)*)' in parents")
+_NAME_RE = re.compile(r"name = '((?:[^'\\]|\\.)*)'")
+_MIME_RE = re.compile(r"mimeType = '([^']*)'")
+
+def _unescape(value: str) -> str:
+    return value.replace("\\'", "'")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+class FakeRequest:
+    def __init__(self, drive, method: str, func):
+        self.drive = drive
+        self.method = method
+        self.methodId = f"drive.{method}"
+        self.func = func
+
+    def _run(self):
+        self.drive._maybe_fail(self.method)
+        with self.drive.lock:
+            self.drive.calls[self.method] += 1
+            return self.drive._copy(self.func())
+
+    def execute(self, num_retries=0):
+        self.drive._round_trip()
+        return self._run()
+
+class FakeBatch:
+    def __init__(self, drive, callback=None):
+        self.drive = drive
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests))
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.drive._round_trip()
+        with self.drive.lock:
+            self.drive.calls["batch"] += 1
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request._run(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+class _Resource:
+    def __init__(self, drive, resource: str, handlers: dict):
+        self.drive = drive
+        self.resource = resource
+        self.handlers = handlers
+
+    def __getattr__(self, name):
+        handler = self.handlers[name]
+        return lambda **kwargs: FakeRequest(self.drive, f"{self.resource}.{name}", lambda: handler(**kwargs))
+
+class FakeDriveService:
+    def __init__(self, latency: float = 0.0, max_page_size: int = 1000, error_rate: float = 0.0,
+                 error_status: int = 403, error_reason: str = "rateLimitExceeded", seed: int = 0):
+        # latency: seconds per HTTP round trip (a batch counts as one)
+        # error_rate: probability that any single call fails with error_status/error_reason
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_reason = error_reason
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.objects = {}
+        self.children = {}
+        self.permissions_by_file = {}
+        self.change_log = []
+        self.calls = Counter()
+        self.http_requests = 0
+        self.injected_errors = 0
+        self._ids = itertools.count(1)
+        self.add_folder("root", parent_id=None, file_id="root")
+
+    # --- tree setup -------------------------------------------------------
+
+    def _new_id(self, prefix: str = "f") -> str:
+        return f"{prefix}{next(self._ids):08d}"
+
+    def _insert(self, metadata: dict) -> dict:
+        self.objects[metadata["id"]] = metadata
+        if metadata["mimeType"] == FOLDER_MIME:
+            self.children.setdefault(metadata["id"], [])
+        for parent_id in metadata.get("parents", []):
+            self.children.setdefault(parent_id, []).append(metadata["id"])
+        self.change_log.append(metadata["id"])
+        return metadata
+
+    def add_folder(self, name: str, parent_id: str = "root", file_id: str = None) -> str:
+        with self.lock:
+            return self._insert({"id": file_id or self._new_id("d"), "name": name, "mimeType": FOLDER_MIME,
+                                 "parents": [parent_id] if parent_id else [], "modifiedTime": _now(),
+                                 "trashed": False})["id"]
+
+    def add_file(self, name: str, parent_id: str, content: str = "", mime_type: str = "text/plain") -> str:
+        with self.lock:
+            return self._insert({"id": self._new_id(), "name": name, "mimeType": mime_type,
+                                 "parents": [parent_id], "modifiedTime": _now(), "trashed": False,
+                                 "md5Checksum": hashlib.md5(content.encode()).hexdigest(),
+                                 "size": str(len(content))})["id"]
+
+    def generate_tree(self, root_id: str, items: int, files_per_folder: int = 20, folders_per_folder: int = 4) -> int:
+        # Breadth-first synthetic tree with about `items` objects below root_id
+        created = 0
+        level = [root_id]
+        while created < items:
+            next_level = []
+            for folder_id in level:
+                for i in range(files_per_folder):
+                    if created >= items:
+                        return created
+                    self.add_file(f"file_{created}.txt", folder_id, content=str(created))
+                    created += 1
+                for i in range(folders_per_folder):
+                    if created >= items:
+                        return created
+                    next_level.append(self.add_folder(f"folder_{created}", folder_id))
+                    created += 1
+            level = next_level or level
+        return created
+
+    # --- service interface -------------------------------------------------
+
+    def files(self):
+        return _Resource(self, "files", {"list": self._files_list, "get": self._files_get, "copy": self._files_copy,
+                                "create": self._files_create, "update": self._files_update,
+                                "delete": self._files_delete})
+
+    def permissions(self):
+        return _Resource(self, "permissions", {"create": self._permissions_create, "list": self._permissions_list})
+
+    def changes(self):
+        return _Resource(self, "changes", {"getStartPageToken": self._changes_start, "list": self._changes_list})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    # --- internals -----------------------------------------------------------
+
+    def _round_trip(self):
+        with self.lock:
+            self.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _maybe_fail(self, method: str):
+        if not self.error_rate:
+            return
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.injected_errors += 1
+        if failed:
+            content = json.dumps({"error": {"code": self.error_status, "message": "Injected error",
+                                            "errors": [{"reason": self.error_reason}]}}).encode()
+            raise HttpError(httplib2.Response({"status": self.error_status}), content)
+
+    def _not_found(self, file_id: str):
+        content = json.dumps({"error": {"code": 404, "message": f"File not found: {file_id}",
+                                        "errors": [{"reason": "notFound"}]}}).encode()
+        return HttpError(httplib2.Response({"status": 404}), content)
+
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, dict):
+            return {k: (list(v) if isinstance(v, list) else v) for k, v in value.items()}
+        return value
+
+    def _get(self, file_id: str) -> dict:
+        metadata = self.objects.get(file_id)
+        if metadata is None or metadata["trashed"]:
+            raise self._not_found(file_id)
+        return metadata
+
+    def _files_list(self, q="", pageSize=100, pageToken=None, **kwargs):
+        parents = [_unescape(p) for p in _PARENT_RE.findall(q)]
+        name = _NAME_RE.search(q)
+        mime = _MIME_RE.search(q)
+        candidates = itertools.chain.from_iterable(self.children.get(p, []) for p in parents)
+        matches = []
+        for file_id in candidates:
+            metadata = self.objects[file_id]
+            if metadata["trashed"]:
+                continue
+            if name and metadata["name"] != _unescape(name.group(1)):
+                continue
+            if mime and metadata["mimeType"] != mime.group(1):
+                continue
+            matches.append(metadata)
+        start = int(pageToken or 0)
+        end = start + min(pageSize or 100, self.max_page_size)
+        result = {"files": [self._copy(m) for m in matches[start:end]]}
+        if end < len(matches):
+            result["nextPageToken"] = str(end)
+        return result
+
+    def _files_get(self, fileId, **kwargs):
+        return self._get(fileId)
+
+    def _files_copy(self, fileId, body=None, **kwargs):
+        source = self._get(fileId)
+        body = body or {}
+        metadata = dict(source, id=self._new_id(), name=body.get("name", source["name"]),
+                        parents=list(body.get("parents", source["parents"])), modifiedTime=_now())
+        return self._insert(metadata)
+
+    def _files_create(self, body=None, **kwargs):
+        body = body or {}
+        metadata = {"id": self._new_id("d" if body.get("mimeType") == FOLDER_MIME else "f"),
+                    "name": body.get("name", "Untitled"), "mimeType": body.get("mimeType", "text/plain"),
+                    "parents": list(body.get("parents", ["root"])), "modifiedTime": _now(), "trashed": False}
+        return self._insert(metadata)
+
+    def _files_update(self, fileId, body=None, addParents=None, removeParents=None, **kwargs):
+        metadata = self._get(fileId)
+        metadata.update(body or {})
+        if removeParents:
+            for parent_id in removeParents.split(","):
+                metadata["parents"].remove(parent_id)
+                self.children[parent_id].remove(fileId)
+        if addParents:
+            for parent_id in addParents.split(","):
+                metadata["parents"].append(parent_id)
+                self.children.setdefault(parent_id, []).append(fileId)
+        metadata["modifiedTime"] = _now()
+        self.change_log.append(fileId)
+        return metadata
+
+    def _files_delete(self, fileId, **kwargs):
+        # Deleting a folder removes everything below it, as on Drive
+        stack = [self._get(fileId)["id"]]
+        while stack:
+            file_id = stack.pop()
+            metadata = self.objects[file_id]
+            if metadata["trashed"]:
+                continue
+            metadata["trashed"] = True
+            for parent_id in metadata["parents"]:
+                if file_id in self.children.get(parent_id, []):
+                    self.children[parent_id].remove(file_id)
+            stack.extend(self.children.get(file_id, []))
+            self.change_log.append(file_id)
+        return ""
+
+    def _permissions_create(self, fileId, body=None, **kwargs):
+        self._get(fileId)
+        permission = dict(body or {}, id=self._new_id("p"))
+        self.permissions_by_file.setdefault(fileId, []).append(permission)
+        return permission
+
+    def _permissions_list(self, fileId, **kwargs):
+        # Folder permissions are inherited by everything below, as in My Drive
+        self._get(fileId)
+        permissions = []
+        pending = [fileId]
+        seen = set()
+        while pending:
+            file_id = pending.pop()
+            if file_id in seen or file_id not in self.objects:
+                continue
+            seen.add(file_id)
+            permissions.extend(self._copy(p) for p in self.permissions_by_file.get(file_id, []))
+            pending.extend(self.objects[file_id].get("parents", []))
+        return {"permissions": permissions}
+
+    def _changes_start(self, **kwargs):
+        return {"startPageToken": str(len(self.change_log))}
+
+    def _changes_list(self, pageToken, pageSize=100, **kwargs):
+        start = int(pageToken)
+        end = min(len(self.change_log), start + min(pageSize or 100, self.max_page_size))
+        changes = []
+        for file_id in self.change_log[start:end]:
+            metadata = self.objects[file_id]
+            changes.append({"fileId": file_id, "removed": False, "file": self._copy(metadata)})
+        result = {"changes": changes}
+        if end < len(self.change_log):
+            result["nextPageToken"] = str(end)
+        else:
+            result["newStartPageToken"] = str(end)
+        return result
+
+def install(fake: FakeDriveService) -> None:
+    # Routes every drive_service call in this process to the fake
+    import drive_service
+    import metadata_cache
+    drive_service.get_drive_service = lambda: fake
+    metadata_cache.folder_ids.clear()
+    metadata_cache.file_metadata.clear()
+    metadata_cache.new_folders.clear()
@@ -1,107 +1,31 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog, scrolledtext, ttk
+from tkinter import messagebox, simpledialog, scrolledtext, ttk, filedialog
 import threading
-import time
-import json
-from datetime import datetime
 import queue
 
 from drive_service import (
     extract_file_id, extract_folder_id, list_files_in_folder,
-    copy_file, delete_file, set_file_permission,
-    get_file_hierarchy, copy_new_items
+    copy_file, set_file_permission,
+    get_file_hierarchy, get_pool_stats
 )
-from config import GOOGLE_ROOT_ID
-
-# Files for monitor tasks and change logs
-MONITOR_TASKS_FILE = "monitor_tasks.json"
-CHANGES_LOG_FILE = "changes_log.json"
+from rate_limiter import get_rate_limit_stats
+from metadata_cache import get_cache_stats
+from metrics import get_metrics, export_metrics
+from monitor import MonitorScheduler, monitor_worker
+from copy_jobs import start_copy_job, resume_copy_jobs
+from rollback import rollback_task, rollback_tasks, resume_rollbacks
+from tree_report import build_tree_index, export_tree_report, format_tree_summary
+from sharing import share_objects, summarize_results
+from state_store import (
+    add_change_record, get_change_page, get_change_operations, remove_monitor_task,
+    get_monitor_tasks, get_monitor_task_page, set_monitor_schedule
+)
+from config import GOOGLE_ROOT_ID, REPORT_PAGE_SIZE, MONITOR_INTERVAL, LOG_MAX_LINES, LOG_BATCH_LIMIT
 
 # Queue for log messages from background threads
 log_queue = queue.Queue()
-
-def load_json(filepath: str):
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-def save_json(filepath: str, data):
-    try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving {filepath}: {e}")
-
-def add_change_record(operation, file_name, file_id, source_id="", dest_id="", comment=""):
-    log_data = load_json(CHANGES_LOG_FILE)
-    record = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "operation": operation,
-        "file_name": file_name,
-        "file_id": file_id,
-        "source_folder_id": source_id,
-        "dest_folder_id": dest_id,
-        "comment": comment
-    }
-    log_data.append(record)
-    save_json(CHANGES_LOG_FILE, log_data)
-
-def add_monitor_task(source_id, dest_id, copied_map=None):
-    if copied_map is None:
-        copied_map = {}
-    tasks = load_json(MONITOR_TASKS_FILE)
-    for t in tasks:
-        if t["source_folder_id"] == source_id and t["dest_folder_id"] == dest_id:
-            return False
-    tasks.append({
-        "source_folder_id": source_id,
-        "dest_folder_id": dest_id,
-        "copied_files": copied_map
-    })
-    save_json(MONITOR_TASKS_FILE, tasks)
-    return True
-
-def remove_monitor_task(source_id, dest_id):
-    tasks = load_json(MONITOR_TASKS_FILE)
-    new_tasks = []
-    removed = False
-    for t in tasks:
-        if t["source_folder_id"] == source_id and t["dest_folder_id"] == dest_id:
-            removed = True
-            continue
-        new_tasks.append(t)
-    if removed:
-        save_json(MONITOR_TASKS_FILE, new_tasks)
-    return removed
-
-def get_monitor_tasks():
-    return load_json(MONITOR_TASKS_FILE)
-
-def check_monitor_tasks(log_callback):
-    tasks = load_json(MONITOR_TASKS_FILE)
-    updated = False
-    for task in tasks:
-        source_id = task["source_folder_id"]
-        dest_id = task["dest_folder_id"]
-        copied_map = task.get("copied_files", {})
-        try:
-            new_map = copy_new_items(source_id, dest_id, copied_map.copy(), base_path="")
-        except Exception as e:
-            log_callback(f"[Monitor] Copy error: {e}")
-            continue
-        if len(new_map) > len(copied_map):
-            task["copied_files"] = new_map
-            updated = True
-            log_callback(f"[Monitor] New files/folders copied.")
-    if updated:
-        save_json(MONITOR_TASKS_FILE, tasks)
-
-def monitor_worker(log_callback):
-    while True:
-        check_monitor_tasks(log_callback)
-        time.sleep(10)
+# Queue of (callback, result) pairs from run_in_background, handled on the Tk thread
+ui_queue = queue.Queue()
 
 class DriveApp:
     def __init__(self, master):
@@ -119,7 +43,9 @@ class DriveApp:
             ("AddMonitor", self.add_monitor_task_cmd),
             ("RemoveMonitor", self.remove_monitor_task_cmd),
             ("Report", self.show_report),
-            ("SetPermissions", self.set_permissions)
+            ("TreeReport", self.tree_report),
+            ("SetPermissions", self.set_permissions),
+            ("BulkPermissions", self.bulk_permissions)
         ]
         for (text, cmd) in commands:
             btn = tk.Button(self.frame_commands, text=text, width=20, command=cmd)
@@ -130,26 +56,97 @@ class DriveApp:
         self.frame_cancel.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
         btn_cancel = tk.Button(self.frame_cancel, text="Cancel All Operations", width=25, command=self.cancel_all_operations)
         btn_cancel.pack(side=tk.LEFT, padx=5)
+        btn_export = tk.Button(self.frame_cancel, text="Export Metrics", width=20, command=self.export_metrics_cmd)
+        btn_export.pack(side=tk.LEFT, padx=5)
+
+        # Live throughput panel: one progress bar per running job
+        self.frame_dashboard = tk.LabelFrame(master, text="Activity")
+        self.frame_dashboard.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
+        self.api_label = tk.Label(self.frame_dashboard, anchor=tk.W)
+        self.api_label.pack(fill=tk.X, padx=5)
+        self.frame_jobs = tk.Frame(self.frame_dashboard)
+        self.frame_jobs.pack(fill=tk.X, padx=5)
+        self.job_rows = {}
 
         self.log_area = scrolledtext.ScrolledText(master, width=100, height=25)
         self.log_area.pack(padx=10, pady=10)
 
         self.master.after(200, self.process_log_queue)
-        self.monitor_thread = threading.Thread(target=monitor_worker, args=(self.threadsafe_log,), daemon=True)
+        self.master.after(1000, self.refresh_dashboard)
+        self.scheduler = MonitorScheduler(self.threadsafe_log)
+        self.monitor_thread = threading.Thread(target=monitor_worker, args=(self.threadsafe_log,),
+                                               kwargs={"scheduler": self.scheduler}, daemon=True)
         self.monitor_thread.start()
+        # Continue copy jobs and rollbacks interrupted by a previous run
+        threading.Thread(target=resume_copy_jobs, args=(self.threadsafe_log,), daemon=True).start()
+        threading.Thread(target=resume_rollbacks, args=(self.threadsafe_log,), daemon=True).start()
 
     def process_log_queue(self):
-        while not log_queue.empty():
-            msg = log_queue.get()
-            self.log(msg)
+        # Everything queued since the last tick goes into the widget as one insert
+        messages = []
+        try:
+            while len(messages) < LOG_BATCH_LIMIT:
+                messages.append(log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if messages:
+            self.log("\n".join(messages[-LOG_MAX_LINES:]))
+        while not ui_queue.empty():
+            callback, result = ui_queue.get()
+            callback(result)
         self.master.after(200, self.process_log_queue)
 
+    def run_in_background(self, func, callback):
+        # Runs func on a worker thread and passes its result to callback on the Tk thread
+        threading.Thread(target=lambda: ui_queue.put((callback, func())), daemon=True).start()
+
+    def refresh_dashboard(self):
+        data = get_metrics()
+        ops = data["operations"].values()
+        calls = sum(op["items"] for op in ops)
+        errors = sum(op["errors"] for op in ops)
+        limits = get_rate_limit_stats()
+        self.api_label.config(text=f"API calls: {calls}  errors: {errors}  retries: {sum(data['retries'].values())}  "
+                                   f"throttled: {limits['throttled']}  rate: {limits['rate']:.1f}/s")
+        jobs = {job["id"]: job for job in data["jobs"]}
+        for job_id in [j for j in self.job_rows if j not in jobs]:
+            self.job_rows.pop(job_id)[0].destroy()
+        for job_id, job in jobs.items():
+            if job_id not in self.job_rows:
+                row = tk.Frame(self.frame_jobs)
+                row.pack(fill=tk.X)
+                bar = ttk.Progressbar(row, length=250)
+                bar.pack(side=tk.LEFT, padx=5)
+                label = tk.Label(row, anchor=tk.W)
+                label.pack(side=tk.LEFT, fill=tk.X)
+                self.job_rows[job_id] = (row, bar, label)
+            _, bar, label = self.job_rows[job_id]
+            bar.config(maximum=max(job["total"], 1), value=job["done"])
+            label.config(text=f"{job['name']}: {job['done']}/{job['total']}  "
+                              f"{job['items_per_second']:.1f} items/s  "
+                              f"{job['bytes_per_second'] / (1024 * 1024):.2f} MB/s  [{job['status']}]")
+        self.master.after(1000, self.refresh_dashboard)
+
+    def export_metrics_cmd(self):
+        try:
+            path = export_metrics()
+            self.log(f"Metrics exported to {path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export metrics: {e}")
+
     def threadsafe_log(self, message):
         log_queue.put(message)
 
     def log(self, message):
+        # The widget keeps the last LOG_MAX_LINES lines; it only follows new
+        # output while scrolled to the bottom
+        at_bottom = self.log_area.yview()[1] >= 1.0
         self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
+        excess = int(self.log_area.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_area.delete("1.0", f"{excess + 1}.0")
+        if at_bottom:
+            self.log_area.see(tk.END)
 
     def copy_files(self):
         source_link = simpledialog.askstring("Copy", "Enter source folder URL:")
@@ -175,38 +172,116 @@ class DriveApp:
         def worker():
             self.threadsafe_log("Starting recursive copy (Copy)...")
             try:
-                copied_map = copy_new_items(source_id, dest_id, {}, base_path="")
-                self.threadsafe_log(f"Copy finished. Total objects copied: {len(copied_map)}")
-                tasks = get_monitor_tasks()
-                exists = any(t["source_folder_id"] == source_id and t["dest_folder_id"] == dest_id for t in tasks)
-                if not exists:
-                    add_monitor_task(source_id, dest_id, copied_map)
-                    self.threadsafe_log("Monitor task created.")
-                add_change_record("copy", "(multiple objects)", "(multiple)", source_id, dest_id, "Recursive copy via Copy")
+                start_copy_job("copy", source_id, dest_id, log_callback=self.threadsafe_log)
+                self.scheduler.wake()
+                stats = get_pool_stats()
+                self.threadsafe_log(f"Drive clients built: {stats['built']}, reused: {stats['reused']}")
+                limits = get_rate_limit_stats()
+                self.threadsafe_log(f"API calls: {limits['calls']}, throttled: {limits['throttled']}, "
+                                    f"retried: {limits['retried']}, quota errors: {limits['quota_errors']}")
+                cache = get_cache_stats()["folder_ids"]
+                self.threadsafe_log(f"Folder cache hits: {cache['hits']}, misses: {cache['misses']}")
             except Exception as e:
                 self.threadsafe_log(f"Copy error: {e}")
 
         threading.Thread(target=worker, daemon=True).start()
 
     def show_monitor_tasks(self):
-        tasks = get_monitor_tasks()
-        if not tasks:
-            messagebox.showinfo("Monitor", "No monitor tasks.")
-            return
         win = tk.Toplevel(self.master)
         win.title("Monitor Tasks")
-        tree = ttk.Treeview(win, columns=("Source", "Destination", "CopiedCount"), show="headings")
+        frame_tree = tk.Frame(win)
+        frame_tree.pack(fill=tk.BOTH, expand=True)
+        tree = ttk.Treeview(frame_tree, columns=("Source", "Destination", "CopiedCount", "Interval", "Priority"),
+                            show="headings")
         tree.heading("Source", text="Source Folder")
         tree.heading("Destination", text="Destination Folder")
         tree.heading("CopiedCount", text="Objects Copied")
-        tree.pack(fill=tk.BOTH, expand=True)
-        for task in tasks:
-            tree.insert("", tk.END,
-                        values=(
-                            task["source_folder_id"],
-                            task["dest_folder_id"],
-                            len(task.get("copied_files", {}))
-                        ))
+        tree.heading("Interval", text="Interval (s)")
+        tree.heading("Priority", text="Priority")
+        scrollbar = ttk.Scrollbar(frame_tree, orient=tk.VERTICAL, command=tree.yview)
+        status = tk.Label(win, text="Loading...")
+        state = {"after_id": 0, "done": False, "loaded": 0, "pending": True}
+
+        # Task summaries are read page by page on a worker thread; the next
+        # page is requested when the view is scrolled to the bottom
+        def show_page(page):
+            state["pending"] = False
+            if not win.winfo_exists():
+                return
+            for task in page:
+                tree.insert("", tk.END, iid=str(task["id"]),
+                            values=(
+                                task["source_folder_id"],
+                                task["dest_folder_id"],
+                                task["copied_count"],
+                                task["poll_interval"] or MONITOR_INTERVAL,
+                                task["priority"]
+                            ))
+            if page:
+                state["after_id"] = page[-1]["id"]
+            state["done"] = len(page) < REPORT_PAGE_SIZE
+            state["loaded"] += len(page)
+            if not state["loaded"]:
+                status.config(text="No monitor tasks.")
+            else:
+                status.config(text=f"{state['loaded']} tasks loaded" + ("" if state["done"] else " (scroll for more)"))
+
+        def load_page():
+            after_id = state["after_id"]
+            self.run_in_background(lambda: get_monitor_task_page(after_id), show_page)
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) >= 1.0 and not state["done"] and not state["pending"]:
+                state["pending"] = True
+                load_page()
+
+        tree.configure(yscrollcommand=on_scroll)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        status.pack(anchor=tk.W, padx=10)
+        load_page()
+
+        def edit_schedule():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showinfo("Monitor", "Select a monitor task first.", parent=win)
+                return
+            values = tree.item(selected[0], "values")
+            interval = simpledialog.askfloat("Schedule", "Polling interval in seconds:", parent=win,
+                                             initialvalue=float(values[3]), minvalue=1)
+            if interval is None:
+                return
+            priority = simpledialog.askinteger("Schedule", "Priority (higher runs first):", parent=win,
+                                               initialvalue=int(values[4]))
+            if priority is None:
+                return
+            set_monitor_schedule(values[0], values[1], interval, priority)
+            tree.item(selected[0], values=values[:3] + (interval, priority))
+            self.scheduler.wake()
+            self.log(f"Monitor schedule updated: {values[0]} -> {values[1]}, every {interval}s, priority {priority}")
+
+        def rollback_selected():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showinfo("Monitor", "Select a monitor task first.", parent=win)
+                return
+            values = tree.item(selected[0], "values")
+            if not messagebox.askyesno("Rollback", f"Delete everything copied from {values[0]} to {values[1]} "
+                                                   f"and remove the task?", parent=win):
+                return
+            task_id = int(selected[0])
+            tree.delete(selected[0])
+
+            def worker():
+                rollback_task(task_id, self.threadsafe_log)
+                self.scheduler.wake()
+            threading.Thread(target=worker, daemon=True).start()
+
+        frame_buttons = tk.Frame(win)
+        frame_buttons.pack(anchor=tk.W, padx=10, pady=5)
+        tk.Button(frame_buttons, text="Schedule...", command=edit_schedule).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_buttons, text="Rollback", command=rollback_selected).pack(side=tk.LEFT, padx=5)
 
     def add_monitor_task_cmd(self):
         source_link = simpledialog.askstring("AddMonitor", "Enter source folder URL:")
@@ -232,12 +307,8 @@ class DriveApp:
         def worker():
             self.threadsafe_log("Starting initial copy for AddMonitor...")
             try:
-                copied_map = copy_new_items(source_id, dest_id, {}, base_path="")
-                self.threadsafe_log(f"Initial copy finished. Total objects copied: {len(copied_map)}")
-                if add_monitor_task(source_id, dest_id, copied_map):
-                    self.threadsafe_log(f"New monitor task added:\nSource: {source_id}\nDestination: {dest_id}")
-                else:
-                    self.threadsafe_log("Monitor task already exists!")
+                start_copy_job("monitor", source_id, dest_id, log_callback=self.threadsafe_log)
+                self.scheduler.wake()
             except Exception as e:
                 self.threadsafe_log(f"Initial copy error: {e}")
 
@@ -263,62 +334,128 @@ class DriveApp:
                 messagebox.showerror("Error", "Could not extract destination folder ID.")
                 return
 
-        removed = remove_monitor_task(source_id, dest_id)
-        if removed:
-            self.log(f"Monitor task removed:\nSource: {source_id}\nDestination: {dest_id}")
-        else:
-            self.log("No monitor task found with the given paths.")
+        # Waits for a running sync of the task, so off the GUI thread
+        def worker():
+            if remove_monitor_task(source_id, dest_id):
+                self.threadsafe_log(f"Monitor task removed:\nSource: {source_id}\nDestination: {dest_id}")
+            else:
+                self.threadsafe_log("No monitor task found with the given paths.")
+
+        threading.Thread(target=worker, daemon=True).start()
 
     def cancel_all_operations(self):
         def worker():
             self.threadsafe_log("Starting cancellation of all operations...")
-            tasks = get_monitor_tasks()
-            if not tasks:
+            if not get_monitor_tasks():
                 self.threadsafe_log("No monitor tasks to cancel.")
                 return
-            for task in tasks:
-                source_id = task.get("source_folder_id", "Unknown")
-                dest_id = task.get("dest_folder_id", "Unknown")
-                self.threadsafe_log(f"Cancelling monitor task: Source: {source_id} -> Destination: {dest_id}")
-                copied_map = task.get("copied_files", {})
-                for rel_path, data in copied_map.items():
-                    # data should be a dict with key "id"
-                    obj_id = data.get("id") if isinstance(data, dict) else None
-                    if not obj_id or len(obj_id.strip()) < 5:
-                        self.threadsafe_log(f"Skipping deletion of object '{rel_path}': invalid ID '{obj_id}'")
-                        continue
-                    try:
-                        delete_file(obj_id)
-                        self.threadsafe_log(f"Deleted object '{rel_path}' (ID: {obj_id})")
-                    except Exception as e:
-                        self.threadsafe_log(f"Error deleting object '{rel_path}': {e}")
-            save_json(MONITOR_TASKS_FILE, [])
-            self.threadsafe_log("All monitor tasks cancelled; all copied objects deleted.")
+            left = rollback_tasks(log_callback=self.threadsafe_log)
+            self.scheduler.wake()
+            if left:
+                self.threadsafe_log(f"Cancellation incomplete: {left} copied objects remain.")
+            else:
+                self.threadsafe_log("All monitor tasks cancelled; all copied objects deleted.")
         threading.Thread(target=worker, daemon=True).start()
 
     def show_report(self):
-        changes = load_json(CHANGES_LOG_FILE)
-        report_lines = ["==== Full Change Report ===="]
-        report_lines.append(f"Google Root ID: {GOOGLE_ROOT_ID}")
-        report_lines.append("")
-        if changes:
-            for rec in sorted(changes, key=lambda x: x["timestamp"]):
-                line = f"{rec['timestamp']} | {rec['operation']} | File: {rec['file_name']} (ID: {rec['file_id']})"
-                if rec['source_folder_id']:
-                    line += f" | From: {rec['source_folder_id']}"
-                if rec['dest_folder_id']:
-                    line += f" | To: {rec['dest_folder_id']}"
-                if rec['comment']:
-                    line += f" | {rec['comment']}"
-                report_lines.append(line)
-        else:
-            report_lines.append("No change records found.")
-        report = "\n".join(report_lines)
         win = tk.Toplevel(self.master)
         win.title("Change Report")
-        txt = scrolledtext.ScrolledText(win, width=100, height=30)
-        txt.insert(tk.END, report)
-        txt.pack()
+        tk.Label(win, text=f"Google Root ID: {GOOGLE_ROOT_ID}").pack(anchor=tk.W, padx=10, pady=5)
+
+        # Filters: time range as "YYYY-MM-DD[ HH:MM:SS]" and operation
+        frame_filter = tk.Frame(win)
+        frame_filter.pack(fill=tk.X, padx=10)
+        tk.Label(frame_filter, text="From:").pack(side=tk.LEFT)
+        entry_from = tk.Entry(frame_filter, width=20)
+        entry_from.pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_filter, text="To:").pack(side=tk.LEFT)
+        entry_to = tk.Entry(frame_filter, width=20)
+        entry_to.pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_filter, text="Operation:").pack(side=tk.LEFT)
+        combo_op = ttk.Combobox(frame_filter, width=15, values=[""] + get_change_operations())
+        combo_op.pack(side=tk.LEFT, padx=5)
+
+        columns = ("Timestamp", "Operation", "File", "FileID", "From", "To", "Comment")
+        frame_tree = tk.Frame(win)
+        frame_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        tree = ttk.Treeview(frame_tree, columns=columns, show="headings", height=25)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        scrollbar = ttk.Scrollbar(frame_tree, orient=tk.VERTICAL, command=tree.yview)
+        status = tk.Label(win, text="")
+        state = {"after_id": 0, "done": False, "loaded": 0, "pending": False, "filters": {}}
+
+        def load_page():
+            state["pending"] = False
+            if state["done"]:
+                return
+            page = get_change_page(state["after_id"], **state["filters"])
+            for rec in page:
+                tree.insert("", tk.END, values=(
+                    rec["timestamp"], rec["operation"], rec["file_name"], rec["file_id"],
+                    rec["source_folder_id"], rec["dest_folder_id"], rec["comment"]))
+            if page:
+                state["after_id"] = page[-1]["id"]
+            if len(page) < REPORT_PAGE_SIZE:
+                state["done"] = True
+            state["loaded"] += len(page)
+            status.config(text=f"{state['loaded']} records loaded" + ("" if state["done"] else " (scroll for more)"))
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            # Fetch the next page once the view reaches the bottom
+            if float(last) >= 1.0 and not state["done"] and not state["pending"]:
+                state["pending"] = True
+                win.after_idle(load_page)
+
+        def apply_filters():
+            end = entry_to.get().strip()
+            if len(end) == 10:
+                end += " 23:59:59"
+            state["filters"] = {"start": entry_from.get().strip() or None,
+                                "end": end or None,
+                                "operation": combo_op.get().strip() or None}
+            state.update(after_id=0, done=False, loaded=0)
+            tree.delete(*tree.get_children())
+            load_page()
+
+        tree.configure(yscrollcommand=on_scroll)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tk.Button(frame_filter, text="Apply", command=apply_filters).pack(side=tk.LEFT, padx=5)
+        status.pack(anchor=tk.W, padx=10, pady=5)
+        load_page()
+
+    def tree_report(self):
+        link = simpledialog.askstring("TreeReport", "Enter folder URL:")
+        if link is None:
+            return
+        folder_id = extract_folder_id(link)
+        if not folder_id:
+            messagebox.showerror("Error", "Could not extract folder ID.")
+            return
+
+        def build():
+            try:
+                return build_tree_index(folder_id, log_callback=self.threadsafe_log)
+            except Exception as e:
+                self.threadsafe_log(f"Tree report error: {e}")
+
+        def done(index):
+            if index is None:
+                return
+            self.log(format_tree_summary(index))
+            path = filedialog.asksaveasfilename(title="Export tree report", defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("JSON", "*.json")])
+            if path:
+                try:
+                    self.log(f"Tree report written to {export_tree_report(index, path)}")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to export tree report: {e}")
+
+        self.threadsafe_log("Building tree report...")
+        self.run_in_background(build, done)
 
     def set_permissions(self):
         file_link = simpledialog.askstring("SetPermissions", "Enter file/folder URL:")
@@ -346,6 +483,54 @@ class DriveApp:
             self.log(f"Error setting permissions: {e}")
             messagebox.showerror("Error", "Error setting permissions.")
 
+    def bulk_permissions(self):
+        links = simpledialog.askstring("BulkPermissions", "Enter file/folder URLs (comma separated):")
+        if not links:
+            return
+        file_ids = []
+        for link in links.replace("\n", ",").split(","):
+            link = link.strip()
+            if not link:
+                continue
+            file_id = extract_file_id(link) or extract_folder_id(link)
+            if not file_id:
+                messagebox.showerror("Error", f"Could not extract file/folder ID from: {link}")
+                return
+            file_ids.append(file_id)
+        emails = simpledialog.askstring("BulkPermissions", "Enter user emails (comma separated):")
+        if not emails:
+            return
+        emails = [email.strip() for email in emails.replace("\n", ",").split(",") if email.strip()]
+        role = simpledialog.askstring("BulkPermissions", "Enter role (reader, writer, owner):")
+        if not role or role.lower() not in ['reader', 'writer', 'owner']:
+            messagebox.showerror("Error", "Invalid role.")
+            return
+        role = role.lower()
+        recursive = messagebox.askyesno("BulkPermissions", "Also share everything inside the folders?")
+
+        def worker():
+            grants = [(email, role) for email in emails]
+            try:
+                results = share_objects(file_ids, grants, recursive=recursive, log_callback=self.threadsafe_log)
+            except Exception as e:
+                self.threadsafe_log(f"Bulk permissions error: {e}")
+                return
+            for result in results:
+                if result["status"] == "created":
+                    self.threadsafe_log(f"Permissions set for {result['path']} ({result['email']}). "
+                                        f"Permission ID: {result['permission_id']}")
+                elif result["status"] == "error":
+                    self.threadsafe_log(f"Error setting permissions for {result['path']} "
+                                        f"({result['email']}): {result['error']}")
+            summary = summarize_results(results)
+            add_change_record("setpermissions", "(multiple objects)", "(multiple)",
+                              comment=f"Permissions {role} for {', '.join(emails)}: {summary['created']} created, "
+                                      f"{summary['present']} already present, {summary['error']} failed")
+            self.threadsafe_log(f"Bulk permissions finished: {summary['created']} created, "
+                                f"{summary['present']} already present, {summary['error']} failed.")
+
+        threading.Thread(target=worker, daemon=True).start()
+
 if __name__ == '__main__':
     root = tk.Tk()
     app = DriveApp(root)
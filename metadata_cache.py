@@ -0,0 +1,77 @@
+import time
+import threading
+from collections import OrderedDict
+
+from config import METADATA_CACHE_SIZE, METADATA_CACHE_TTL
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire after ttl seconds
+    def __init__(self, maxsize: int = METADATA_CACHE_SIZE, ttl: float = METADATA_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+# (folder name, parent ID) -> folder ID
+folder_ids = TTLCache()
+# file ID -> {"id", "name", "parents", "mimeType"}
+file_metadata = TTLCache()
+# Folders created by this process: their only children are ones we created,
+# so a name lookup that misses the cache can skip the Drive query
+new_folders = TTLCache()
+
+def remember_folder(name: str, parent_id: str, folder_id: str, created: bool = False):
+    folder_ids.put((name, parent_id), folder_id)
+    file_metadata.put(folder_id, {"id": folder_id, "name": name, "parents": [parent_id],
+                                  "mimeType": "application/vnd.google-apps.folder"})
+    if created:
+        new_folders.put(folder_id, True)
+
+def invalidate(file_id: str):
+    metadata = file_metadata.pop(file_id)
+    new_folders.pop(file_id)
+    if metadata:
+        for parent_id in metadata.get("parents", []):
+            folder_ids.pop((metadata.get("name"), parent_id))
+    else:
+        # Name unknown, so drop any name lookup that resolves to this ID
+        with folder_ids.lock:
+            stale = [key for key, (value, _) in folder_ids.data.items() if value == file_id]
+            for key in stale:
+                del folder_ids.data[key]
+
+def get_cache_stats() -> dict:
+    stats = {}
+    for name, cache in (("folder_ids", folder_ids), ("file_metadata", file_metadata)):
+        stats[name] = {"hits": cache.hits, "misses": cache.misses, "size": len(cache.data)}
+    return stats
@@ -0,0 +1,117 @@
+import json
+import time
+import itertools
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from config import METRICS_FILE
+
+# Latency histogram bucket upper bounds in milliseconds; the last bucket is open
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_lock = threading.Lock()
+_operations = {}
+_retries = Counter()
+_jobs = {}
+_job_ids = itertools.count(1)
+_started = time.time()
+
+def _operation(name: str) -> dict:
+    op = _operations.get(name)
+    if op is None:
+        op = _operations[name] = {"calls": 0, "errors": 0, "items": 0, "seconds": 0.0,
+                                  "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+    return op
+
+def record_call(name: str, seconds: float, errors: int = 0, items: int = 1):
+    # One round trip carrying items requests of one operation (several when
+    # batched), of which errors failed
+    with _lock:
+        op = _operation(name)
+        op["calls"] += 1
+        op["items"] += items
+        op["seconds"] += seconds
+        op["errors"] += errors
+        op["histogram"][bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+def record_retry(name: str):
+    # Keyed by the Drive method ID, as in record_call
+    with _lock:
+        _retries[name] += 1
+
+class JobProgress:
+    # Progress of one running copy or monitor job, shown in the GUI dashboard
+    # once registered in _jobs
+    def __init__(self, name: str):
+        self.id = next(_job_ids)
+        self.registered = False
+        self.name = name
+        self.total = 0
+        self.done = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.status = "running"
+
+    def add_total(self, count: int):
+        with _lock:
+            self.total += count
+            if count and not self.registered:
+                _register(self)
+
+    def advance(self, count: int = 1, size: int = 0):
+        with _lock:
+            self.done += count
+            self.bytes += size
+
+    def finish(self, status: str = "done"):
+        with _lock:
+            self.finished = time.monotonic()
+            self.status = status
+
+    def snapshot(self) -> dict:
+        elapsed = max((self.finished or time.monotonic()) - self.started, 1e-6)
+        return {"id": self.id, "name": self.name, "status": self.status, "total": self.total,
+                "done": self.done, "bytes": self.bytes, "seconds": elapsed,
+                "items_per_second": self.done / elapsed, "bytes_per_second": self.bytes / elapsed}
+
+def _register(job: JobProgress):
+    job.registered = True
+    _jobs[job.id] = job
+
+def start_job(name: str, lazy: bool = False) -> JobProgress:
+    # A lazy job is only listed once it has something to do, so idle monitor
+    # polls don't crowd the dashboard
+    job = JobProgress(name)
+    if not lazy:
+        with _lock:
+            _register(job)
+    return job
+
+def get_jobs(keep_finished: float = 30) -> list:
+    # Running jobs plus those finished within the last keep_finished seconds
+    now = time.monotonic()
+    with _lock:
+        for job_id in [j.id for j in _jobs.values() if j.finished and now - j.finished > keep_finished]:
+            del _jobs[job_id]
+        return [job.snapshot() for job in _jobs.values()]
+
+def get_metrics() -> dict:
+    with _lock:
+        operations = {}
+        for name, op in _operations.items():
+            operations[name] = dict(op, histogram=dict(zip(
+                [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"], op["histogram"])),
+                avg_ms=op["seconds"] * 1000 / op["calls"] if op["calls"] else 0.0)
+        retries = dict(_retries)
+    return {"uptime_seconds": time.time() - _started, "operations": operations, "retries": retries,
+            "jobs": get_jobs()}
+
+def export_metrics(path: str = METRICS_FILE) -> str:
+    from rate_limiter import get_rate_limit_stats
+    data = get_metrics()
+    data["rate_limit"] = get_rate_limit_stats()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
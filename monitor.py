@@ -0,0 +1,314 @@
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from drive_service import iter_files_in_folder, list_changes, batch_delete_files, SYNC_LIST_FIELDS
+from copy_engine import copy_tree
+from change_sync import sync_task
+from metrics import start_job
+from rollback import deletable_items
+from state_store import (
+    get_monitor_task, get_monitor_tasks, get_monitor_schedules, load_monitor_task, save_monitor_task, task_lock,
+    take_lease, release_lease, was_rolled_back
+)
+from config import (
+    MONITOR_SYNC_MODE, MONITOR_INTERVAL, MONITOR_WORKERS, MONITOR_CACHE_TASKS,
+    MONITOR_IDLE_BACKOFF, MONITOR_IDLE_MAX_INTERVAL, MONITOR_ERROR_MAX_BACKOFF, MONITOR_GROUP_WINDOW
+)
+
+class SourceSnapshot:
+    # Source listings and change pages fetched while polling one source,
+    # shared by all tasks copying that source to different destinations so
+    # the source is read once per poll instead of once per task
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders = {}
+        self.changes = {}
+
+    def list_folder(self, folder_id: str) -> list:
+        with self.lock:
+            items = self.folders.get(folder_id)
+        if items is None:
+            items = list(iter_files_in_folder(folder_id, fields=SYNC_LIST_FIELDS))
+            with self.lock:
+                self.folders[folder_id] = items
+        return items
+
+    def list_changes(self, page_token: str) -> tuple:
+        # Tasks polled together end on the same token, so after the first
+        # poll they all read the changes feed from the same position
+        with self.lock:
+            result = self.changes.get(page_token)
+        if result is None:
+            result = list_changes(page_token)
+            with self.lock:
+                self.changes[page_token] = result
+        return result
+
+def group_by_source(tasks: list) -> list:
+    groups = {}
+    for task in tasks:
+        groups.setdefault(task["source_folder_id"], []).append(task)
+    return list(groups.values())
+
+# Loaded tasks are kept between polls and reused while the stored token and
+# copied count still match what is in memory, i.e. while no other process
+# has written the task since
+_task_cache = {}
+_task_cache_lock = threading.Lock()
+
+def _load_task(task_id: int) -> dict:
+    summary = get_monitor_task(task_id)
+    if summary is None or summary["rollback"]:
+        forget_task(task_id)
+        return None
+    if not MONITOR_CACHE_TASKS:
+        return load_monitor_task(task_id)
+    with _task_cache_lock:
+        task = _task_cache.get(task_id)
+    if (task is None or task.get("start_page_token") != summary["start_page_token"]
+            or len(task["copied_files"]) != summary["copied_count"]):
+        task = load_monitor_task(task_id)
+        with _task_cache_lock:
+            _task_cache[task_id] = task
+    return task
+
+def forget_task(task_id: int):
+    with _task_cache_lock:
+        _task_cache.pop(task_id, None)
+
+def check_monitor_task(task_id: int, log_callback, raise_errors: bool = False,
+                       snapshot: SourceSnapshot = None) -> int:
+    # Syncs one monitor task and returns the number of newly copied objects.
+    # With raise_errors the sync error is re-raised after the progress is saved.
+    # A task already syncing or being rolled back, in this process or another
+    # one sharing the database (the GUI and the daemon), is skipped.
+    lock = task_lock(task_id)
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        if not take_lease("tasks", task_id):
+            return 0
+        try:
+            return _check_monitor_task(task_id, log_callback, raise_errors, snapshot)
+        finally:
+            release_lease("tasks", task_id)
+    finally:
+        lock.release()
+
+def _check_monitor_task(task_id: int, log_callback, raise_errors: bool, snapshot: SourceSnapshot) -> int:
+    task = _load_task(task_id)
+    if task is None:
+        return 0
+    copied_map = task["copied_files"]
+    before = (len(copied_map), task.get("start_page_token"))
+    # Objects created by this poll, for _discard_copies
+    created = task["created"] = []
+    progress = start_job(f"monitor {task['source_folder_id']} -> {task['dest_folder_id']}", lazy=True)
+    status = "done"
+    error = None
+    try:
+        if MONITOR_SYNC_MODE == "changes":
+            sync_task(task, log_callback, snapshot)
+        else:
+            copy_tree(task["source_folder_id"], task["dest_folder_id"], copied_map, progress=progress,
+                      lister=snapshot.list_folder if snapshot else None, created=created)
+    except Exception as e:
+        status = "failed"
+        error = e
+        log_callback(f"[Monitor] Sync error: {e}")
+    copied_count = len(task["copied_files"]) - before[0]
+    if MONITOR_SYNC_MODE == "changes":
+        progress.add_total(max(copied_count, 0))
+        progress.advance(max(copied_count, 0))
+    progress.finish(status)
+    if copied_count > 0:
+        log_callback(f"[Monitor] New files/folders copied: {copied_count}")
+    copied_map = task["copied_files"]
+    if copied_map.dirty or copied_map.removed or task.get("start_page_token") != before[1]:
+        try:
+            save_monitor_task(task)
+        except sqlite3.IntegrityError:
+            # The task was removed by another process during the sync (one
+            # rolling it back only does so after this lease has expired)
+            forget_task(task_id)
+            if was_rolled_back(task_id):
+                _discard_copies(task, created, log_callback)
+            return 0
+    if error is not None and raise_errors:
+        raise error
+    return copied_count
+
+def _discard_copies(task: dict, created: list, log_callback):
+    # Deletes the objects a sync created for a task rolled back meanwhile;
+    # copies moved or updated by the sync were made by earlier polls and
+    # were already deleted by the rollback
+    created = set(created)
+    new = {path: entry for path, entry in task["copied_files"].items() if entry["id"] in created}
+    roots, _, _ = deletable_items(task["id"], new)
+    errors = batch_delete_files([new[path]["id"] for path in roots])
+    log_callback(f"[Monitor] Task {task['id']} was rolled back during the sync; removed "
+                 f"{errors.count(None)} of {len(roots)} objects it had copied")
+
+def check_monitor_tasks(log_callback, max_workers: int = MONITOR_WORKERS) -> int:
+    # Tasks of one source run one after another on a shared snapshot
+    summaries = [t for t in get_monitor_tasks() if not t["rollback"]]
+    if not summaries:
+        return 0
+
+    def check_group(tasks):
+        snapshot = SourceSnapshot()
+        return sum(check_monitor_task(t["id"], log_callback, snapshot=snapshot) for t in tasks)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return sum(pool.map(check_group, group_by_source(summaries)))
+
+class TaskSchedule:
+    # Polling state of one monitor task inside MonitorScheduler
+    __slots__ = ("task_id", "source_id", "interval", "priority", "next_run", "idle_polls", "failures")
+
+    def __init__(self, task_id: int, source_id: str, interval: float, priority: int):
+        self.task_id = task_id
+        self.source_id = source_id
+        self.interval = interval
+        self.priority = priority
+        self.next_run = time.monotonic()
+        self.idle_polls = 0
+        self.failures = 0
+
+    def delay(self) -> float:
+        # Seconds until the next poll, given the outcome of the last one.
+        # The exponents are capped: the caps are reached long before, and
+        # an unbounded power overflows a float after enough quiet polls.
+        if self.failures:
+            return min(self.interval * 2 ** min(self.failures, 32), max(self.interval, MONITOR_ERROR_MAX_BACKOFF))
+        if self.idle_polls:
+            return min(self.interval * MONITOR_IDLE_BACKOFF ** min(self.idle_polls, 32),
+                       max(self.interval, MONITOR_IDLE_MAX_INTERVAL))
+        return self.interval
+
+class MonitorScheduler:
+    # Runs every monitor task as an independent job: each task has its own
+    # interval and priority, at most max_workers sources sync at once, and
+    # idle or failing tasks are polled less often. When a task is due, the
+    # other tasks of its source due within MONITOR_GROUP_WINDOW seconds are
+    # polled with it on one shared SourceSnapshot; the rest keep their own
+    # schedule. Task settings come from state_store and are re-read
+    # every refresh seconds or after wake().
+    def __init__(self, log_callback, max_workers: int = MONITOR_WORKERS,
+                 default_interval: float = MONITOR_INTERVAL, refresh: float = MONITOR_INTERVAL):
+        self.log_callback = log_callback
+        self.max_workers = max_workers
+        self.default_interval = default_interval
+        self.refresh = refresh
+        self.schedules = {}
+        self.running = set()
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.refreshed = 0.0
+
+    def wake(self):
+        # Reload task settings and poll new tasks without waiting for the refresh
+        self.refreshed = 0.0
+        self.wake_event.set()
+
+    def _refresh(self):
+        rows = get_monitor_schedules()
+        with self.lock:
+            for row in rows:
+                interval = row["poll_interval"] or self.default_interval
+                schedule = self.schedules.get(row["id"])
+                if schedule is None:
+                    self.schedules[row["id"]] = TaskSchedule(row["id"], row["source_folder_id"],
+                                                             interval, row["priority"])
+                else:
+                    schedule.interval, schedule.priority = interval, row["priority"]
+            for task_id in set(self.schedules) - {row["id"] for row in rows}:
+                del self.schedules[task_id]
+                forget_task(task_id)
+        self.refreshed = time.monotonic()
+
+    def _due(self, now: float) -> list:
+        # Groups of schedules to run, one group per source and worker
+        with self.lock:
+            idle = [s for s in self.schedules.values() if s.task_id not in self.running]
+            due = sorted((s for s in idle if s.next_run <= now), key=lambda s: (-s.priority, s.next_run))
+            busy_sources = {self.schedules[t].source_id for t in self.running if t in self.schedules}
+            groups = []
+            for schedule in due:
+                if len(busy_sources) >= self.max_workers:
+                    break
+                if schedule.source_id in busy_sources:
+                    continue
+                busy_sources.add(schedule.source_id)
+                group = [s for s in idle if s.source_id == schedule.source_id
+                         and s.next_run <= now + MONITOR_GROUP_WINDOW]
+                self.running.update(s.task_id for s in group)
+                groups.append(group)
+        return groups
+
+    def _run_group(self, group: list):
+        snapshot = SourceSnapshot()
+        try:
+            for schedule in group:
+                self._run_task(schedule, snapshot)
+        except Exception as e:
+            self.log_callback(f"[Monitor] Scheduling error: {e}")
+        finally:
+            # Tasks left unrun by an error are released and polled again
+            with self.lock:
+                self.running.difference_update(s.task_id for s in group)
+            self.wake_event.set()
+
+    def _run_task(self, schedule: TaskSchedule, snapshot: SourceSnapshot = None):
+        try:
+            copied_count = check_monitor_task(schedule.task_id, self.log_callback, raise_errors=True,
+                                              snapshot=snapshot)
+            schedule.failures = 0
+            schedule.idle_polls = 0 if copied_count else schedule.idle_polls + 1
+        except Exception:
+            schedule.failures += 1
+            if schedule.failures > 1:
+                self.log_callback(f"[Monitor] Task {schedule.task_id} failed {schedule.failures} times in a row, "
+                                  f"next attempt in {schedule.delay():.0f}s")
+        finally:
+            with self.lock:
+                self.running.discard(schedule.task_id)
+                schedule.next_run = time.monotonic() + schedule.delay()
+            self.wake_event.set()
+
+    def _next_wakeup(self, now: float) -> float:
+        with self.lock:
+            waiting = [s.next_run for s in self.schedules.values() if s.task_id not in self.running]
+            busy_sources = {self.schedules[t].source_id for t in self.running if t in self.schedules}
+        wakeup = self.refreshed + self.refresh
+        if waiting and len(busy_sources) < self.max_workers:
+            wakeup = min(wakeup, min(waiting))
+        # Wake at least once a second so that stop_event is noticed promptly
+        return min(max(wakeup - now, 0.05), 1.0)
+
+    def run(self, stop_event: threading.Event):
+        # Schedules until stop_event is set, then waits for the running syncs
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                if now - self.refreshed >= self.refresh:
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        self.log_callback(f"[Monitor] Could not load tasks: {e}")
+                        self.refreshed = now
+                for group in self._due(now):
+                    pool.submit(self._run_group, group)
+                self.wake_event.wait(self._next_wakeup(time.monotonic()))
+                self.wake_event.clear()
+
+def monitor_worker(log_callback, stop_event: threading.Event = None, interval: float = MONITOR_INTERVAL,
+                   max_workers: int = MONITOR_WORKERS, scheduler: MonitorScheduler = None):
+    # Polls until stop_event is set; syncs in progress are always finished
+    if stop_event is None:
+        stop_event = threading.Event()
+    if scheduler is None:
+        scheduler = MonitorScheduler(log_callback, max_workers=max_workers, default_interval=interval)
+    scheduler.run(stop_event)
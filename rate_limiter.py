@@ -0,0 +1,130 @@
+import json
+import time
+import random
+import threading
+import httplib2
+from googleapiclient.errors import HttpError
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from metrics import record_retry
+from config import API_RATE_PER_SECOND, API_BURST, API_MAX_ATTEMPTS, API_BACKOFF_MAX
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+QUOTA_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "sharingRateLimitExceeded"}
+
+_stats = {"calls": 0, "throttled": 0, "throttled_seconds": 0.0, "retried": 0, "quota_errors": 0}
+_stats_lock = threading.Lock()
+
+def _count(key: str, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+class TokenBucket:
+    # Client-side token bucket shared by all threads. The refill rate backs
+    # off multiplicatively on quota errors and recovers slowly on success.
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        # Blocks until the tokens are available; returns the time waited.
+        # More tokens than the bucket holds are taken in capacity-sized slices.
+        waited = 0.0
+        while tokens > 0:
+            chunk = min(tokens, self.capacity)
+            with self.lock:
+                self._refill()
+                if self.tokens >= chunk:
+                    self.tokens -= chunk
+                    tokens -= chunk
+                    continue
+                delay = (chunk - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+        _count("calls")
+        if waited:
+            _count("throttled")
+            _count("throttled_seconds", waited)
+        return waited
+
+    def penalize(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+drive_limiter = TokenBucket(API_RATE_PER_SECOND, API_BURST)
+
+def error_reason(error: HttpError) -> str:
+    details = getattr(error, "error_details", None)
+    if isinstance(details, list):
+        for detail in details:
+            if isinstance(detail, dict) and detail.get("reason"):
+                return detail["reason"]
+    try:
+        data = json.loads(error.content.decode("utf-8"))
+        return data["error"]["errors"][0]["reason"]
+    except Exception:
+        return ""
+
+def is_quota_error(error: BaseException) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    return error.resp.status == 403 and error_reason(error) in QUOTA_REASONS
+
+def is_retryable_error(error: BaseException) -> bool:
+    # Quota and server errors are worth retrying; other 4xx responses are not
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES or is_quota_error(error)
+    return isinstance(error, (ConnectionError, TimeoutError, httplib2.HttpLib2Error))
+
+def _before_sleep(retry_state):
+    _count("retried")
+    error = retry_state.outcome.exception()
+    # drive_service tags errors of Drive calls with their method ID
+    record_retry(getattr(error, "operation", retry_state.fn.__name__))
+    if is_quota_error(error):
+        _count("quota_errors")
+        drive_limiter.penalize()
+
+def backoff_delay(attempt: int) -> float:
+    # Full-jitter exponential backoff, for retry loops outside tenacity
+    return random.uniform(0, min(API_BACKOFF_MAX, 2 ** attempt))
+
+def note_retry(error: BaseException, operations=()):
+    # One retry of a batch, recorded for each Drive method being re-sent
+    _count("retried")
+    for operation in operations:
+        record_retry(operation)
+    if is_quota_error(error):
+        _count("quota_errors")
+        drive_limiter.penalize()
+
+api_retry = retry(
+    retry=retry_if_exception(is_retryable_error),
+    wait=wait_random_exponential(multiplier=1, max=API_BACKOFF_MAX),
+    stop=stop_after_attempt(API_MAX_ATTEMPTS),
+    before_sleep=_before_sleep,
+    reraise=True
+)
+
+def get_rate_limit_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["rate"] = drive_limiter.rate
+    return stats
@@ -0,0 +1,182 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+
+from drive_service import batch_delete_files
+from state_store import (
+    get_monitor_task, get_monitor_tasks, load_monitor_task, save_monitor_task, mark_monitor_rollback,
+    get_rollback_tasks, delete_monitor_task, add_change_record, task_lock, take_lease, release_lease,
+    shared_item_ids
+)
+from config import COPY_WORKERS, BATCH_LIMIT, LEASE_RETRY
+
+# A rollback deletes the copied objects of a monitor task. The task is first
+# marked so the scheduler stops syncing it; its copied_items rows are then
+# removed as the deletes succeed, so an interrupted rollback resumes with
+# whatever is left (resume_rollbacks) and the task row goes last.
+
+def _valid_id(entry) -> bool:
+    obj_id = entry.get("id") if isinstance(entry, dict) else None
+    return bool(obj_id) and len(obj_id.strip()) >= 5
+
+def top_level_items(copied_map: dict, shared: set = frozenset()) -> tuple:
+    # Returns ({root_path: [paths deleted with it]}, [paths with invalid IDs],
+    # [folders to keep]). Deleting a folder removes its contents, so only the
+    # outermost valid copied objects are deleted; an entry with an invalid ID
+    # doesn't cover the entries below it. Nor does a folder the task reused
+    # instead of creating, or one whose ID is in shared: it may hold other
+    # tasks' copies or the user's own files, so it stays and its copied
+    # contents are deleted one by one.
+    roots = {}
+    invalid = []
+    reused = []
+    for path in sorted(copied_map, key=lambda p: p.count("/")):
+        entry = copied_map[path]
+        if not _valid_id(entry):
+            invalid.append(path)
+            continue
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            ancestor = "/".join(parts[:depth])
+            if ancestor in roots:
+                roots[ancestor].append(path)
+                break
+        else:
+            if entry.get("reused") or entry["id"] in shared:
+                reused.append(path)
+            else:
+                roots[path] = [path]
+    return roots, invalid, reused
+
+def deletable_items(task_id: int, copied_map: dict) -> tuple:
+    # top_level_items, also keeping folders other tasks or copy jobs recorded
+    # too; keeping one exposes its contents as roots, so repeat until stable
+    shared = set()
+    while True:
+        roots, invalid, kept = top_level_items(copied_map, shared)
+        more = shared_item_ids(task_id, [copied_map[path]["id"] for path in roots])
+        if not more:
+            return roots, invalid, kept
+        shared |= more
+
+def _is_gone(error) -> bool:
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+def _delete_copies(task: dict, log, max_workers: int, stop_event=None) -> tuple:
+    # One pass over the task's copied objects; returns (top-level objects
+    # deleted, objects that failed)
+    copied_map = task["copied_files"]
+    roots, invalid, kept = deletable_items(task["id"], copied_map)
+    for path in invalid:
+        log(f"Skipping deletion of object '{path}': invalid ID '{copied_map[path].get('id')}'")
+        copied_map.pop(path)
+    for path in kept:
+        log(f"Keeping folder '{path}': it is not this task's alone")
+        copied_map.pop(path)
+    log(f"Rolling back {task['source_folder_id']} -> {task['dest_folder_id']}: "
+        f"{len(roots)} top-level objects cover {sum(len(p) for p in roots.values())} copied objects")
+
+    def delete_chunk(chunk):
+        if stop_event and stop_event.is_set():
+            return chunk, None
+        return chunk, batch_delete_files([copied_map[path]["id"] for path in chunk])
+
+    root_paths = list(roots)
+    chunks = [root_paths[i:i + BATCH_LIMIT] for i in range(0, len(root_paths), BATCH_LIMIT)]
+    deleted = failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Results are handled on this thread, which owns the task's connection
+        for chunk, errors in pool.map(delete_chunk, chunks):
+            if errors is None:
+                continue
+            for path, error in zip(chunk, errors):
+                if error is None or _is_gone(error):
+                    log(f"Deleted object '{path}' (ID: {copied_map[path]['id']})")
+                    deleted += 1
+                    for covered in roots[path]:
+                        copied_map.pop(covered)
+                else:
+                    failed += 1
+                    log(f"Error deleting object '{path}': {error}")
+            save_monitor_task(task)
+    if (invalid or kept) and not chunks:
+        save_monitor_task(task)
+    return deleted, failed
+
+def rollback_task(task_id: int, log_callback=None, max_workers: int = COPY_WORKERS, stop_event=None) -> int:
+    # Deletes everything copied by one task and removes the task.
+    # Returns the number of objects still left (0 when the rollback finished).
+    # Once stop_event is set no further batches are sent.
+    log = log_callback or (lambda message: None)
+    mark_monitor_rollback(task_id)
+    # A sync or rollback of the task running in this process is waited for,
+    # and so is one in another process, through the task's lease
+    with task_lock(task_id):
+        waiting = False
+        while not take_lease("tasks", task_id):
+            summary = get_monitor_task(task_id)
+            if summary is None:
+                return 0
+            if stop_event and stop_event.is_set():
+                log("Rollback stopped while the task was busy in another process; "
+                    "it will continue on the next start")
+                return summary["copied_count"]
+            if not waiting:
+                log(f"Task {task_id} is busy in another process; waiting to roll it back...")
+                waiting = True
+            time.sleep(LEASE_RETRY)
+        try:
+            return _rollback_task(task_id, log, max_workers, stop_event)
+        finally:
+            release_lease("tasks", task_id)
+
+def _rollback_task(task_id: int, log, max_workers: int, stop_event) -> int:
+    deleted = 0
+    # Should the lease expire, a sync in another process may still save new
+    # copies after the map was read, so the map is read again after each pass
+    # until the task can be removed with nothing left; a sync saving after
+    # that discards its own copies.
+    while True:
+        task = load_monitor_task(task_id)
+        if task is None:
+            return 0
+        if not task["copied_files"] and delete_monitor_task(task_id):
+            break
+        done, failed = _delete_copies(task, log, max_workers, stop_event)
+        deleted += done
+        copied_map = task["copied_files"]
+        if copied_map and stop_event and stop_event.is_set():
+            log(f"Rollback stopped with {len(copied_map)} objects left; it will continue on the next start")
+            return len(copied_map)
+        if copied_map:
+            log(f"Rollback incomplete: {failed} objects could not be deleted; "
+                f"it will be retried on the next start")
+            return len(copied_map)
+    add_change_record("rollback", "(multiple objects)", "(multiple)", task["source_folder_id"],
+                      task["dest_folder_id"], f"Rolled back {deleted} top-level objects")
+    log(f"Monitor task cancelled: {task['source_folder_id']} -> {task['dest_folder_id']}")
+    return 0
+
+def rollback_tasks(task_ids: list = None, log_callback=None, stop_event=None) -> int:
+    # Rolls back the given tasks (all tasks by default); returns objects left
+    if task_ids is None:
+        task_ids = [task["id"] for task in get_monitor_tasks()]
+    left = 0
+    for task_id in task_ids:
+        if stop_event and stop_event.is_set():
+            break
+        try:
+            left += rollback_task(task_id, log_callback, stop_event=stop_event)
+        except Exception as e:
+            if log_callback:
+                log_callback(f"Rollback of task {task_id} failed: {e}")
+            left += 1
+    return left
+
+def resume_rollbacks(log_callback=None, stop_event=None) -> int:
+    # Continues rollbacks left unfinished by a previous run
+    task_ids = get_rollback_tasks()
+    if task_ids and log_callback:
+        log_callback(f"Resuming {len(task_ids)} unfinished rollbacks...")
+    rollback_tasks(task_ids, log_callback, stop_event)
+    return len(task_ids)
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from drive_service import batch_list_permissions, batch_create_permissions
+from tree_report import build_tree_index
+from config import COPY_WORKERS, BATCH_LIMIT
+
+# Bulk sharing: applies (email, role) grants to a list of objects and,
+# optionally, to everything below the folders among them. Objects are
+# handled one tree level at a time, parents first: each level's existing
+# permissions are read in batches and only the missing grants are created.
+# Drive passes folder permissions down to the contents, so once a folder
+# has been shared its descendants usually find the grant already present.
+
+# Higher roles include the lower ones
+ROLE_RANK = {"reader": 1, "commenter": 2, "writer": 3, "fileOrganizer": 4, "organizer": 5, "owner": 6}
+
+def _has_grant(permissions: list, email: str, role: str) -> bool:
+    email = email.lower()
+    return any(p.get("type") == "user" and (p.get("emailAddress") or "").lower() == email
+               and ROLE_RANK.get(p.get("role"), 0) >= ROLE_RANK.get(role, 0)
+               for p in permissions)
+
+def collect_targets(file_ids: list, recursive: bool = False, log_callback=None) -> list:
+    # Returns [(depth, file_id, path)]; with recursive, folders bring their subtree
+    targets = []
+    seen = set()
+    for file_id in file_ids:
+        if recursive:
+            # A plain file comes back as a tree of one object
+            index = build_tree_index(file_id, log_callback=log_callback)
+            entries = [(node["depth"], node["id"], node["path"] or node["name"])
+                       for node in (index["nodes"][node_id] for node_id in index["order"])]
+        else:
+            entries = [(0, file_id, file_id)]
+        for depth, target_id, path in entries:
+            if target_id not in seen:
+                seen.add(target_id)
+                targets.append((depth, target_id, path))
+    return targets
+
+def _run_chunks(func, items: list, max_workers: int) -> list:
+    chunks = [items[i:i + BATCH_LIMIT] for i in range(0, len(items), BATCH_LIMIT)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return [result for chunk_results in pool.map(func, chunks) for result in chunk_results]
+
+def share_objects(file_ids: list, grants: list, recursive: bool = False, log_callback=None,
+                  max_workers: int = COPY_WORKERS) -> list:
+    # grants: (email, role) pairs. Returns one result dict per object and
+    # grant: {"id", "path", "email", "role", "status", "permission_id", "error"}
+    # with status "created", "present" or "error".
+    log = log_callback or (lambda message: None)
+    targets = collect_targets(file_ids, recursive, log_callback)
+    log(f"Sharing {len(targets)} objects with {len(grants)} grants...")
+    results = []
+    for depth in sorted({t[0] for t in targets}):
+        level = [(file_id, path) for (d, file_id, path) in targets if d == depth]
+        existing = _run_chunks(lambda chunk: batch_list_permissions([file_id for file_id, _ in chunk]),
+                               level, max_workers)
+        to_create = []
+        for (file_id, path), (permissions, error) in zip(level, existing):
+            for email, role in grants:
+                result = {"id": file_id, "path": path, "email": email, "role": role,
+                          "status": "present", "permission_id": None, "error": None}
+                if error is not None:
+                    # Unreadable permissions: try the grant anyway
+                    to_create.append(result)
+                elif _has_grant(permissions, email, role):
+                    results.append(result)
+                else:
+                    to_create.append(result)
+        created = _run_chunks(lambda chunk: batch_create_permissions([(r["id"], r["email"], r["role"])
+                                                                      for r in chunk]),
+                              to_create, max_workers)
+        for result, (permission_id, error) in zip(to_create, created):
+            if error is None:
+                result.update(status="created", permission_id=permission_id)
+            else:
+                result.update(status="error", error=str(error))
+            results.append(result)
+        log(f"[Share] Level {depth}: {len(level)} objects, {len(to_create)} grants created or attempted")
+    return results
+
+def summarize_results(results: list) -> dict:
+    summary = {"created": 0, "present": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return summary
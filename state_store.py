@@ -0,0 +1,636 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+
+from copied_map import CopiedMap
+from config import STATE_DB_FILE, CHANGE_LOG_MAX_ROWS, CHANGE_LOG_ARCHIVES, REPORT_PAGE_SIZE, LEASE_SECONDS
+
+# Legacy JSON state files, imported once into the database
+MONITOR_TASKS_FILE = "monitor_tasks.json"
+CHANGES_LOG_FILE = "changes_log.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_folder_id TEXT NOT NULL,
+    dest_folder_id TEXT NOT NULL,
+    start_page_token TEXT,
+    poll_interval REAL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    rollback INTEGER NOT NULL DEFAULT 0,
+    copied_count INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    UNIQUE (source_folder_id, dest_folder_id)
+);
+CREATE TABLE IF NOT EXISTS copied_items (
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source_id TEXT,
+    modified TEXT,
+    md5 TEXT,
+    size TEXT,
+    reused INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (task_id, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS source_folders (
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    folder_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (task_id, folder_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    file_name TEXT,
+    file_id TEXT,
+    source_folder_id TEXT,
+    dest_folder_id TEXT,
+    comment TEXT
+);
+CREATE TABLE IF NOT EXISTS copy_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    source_folder_id TEXT NOT NULL,
+    dest_folder_id TEXT NOT NULL,
+    start_page_token TEXT,
+    created TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id INTEGER NOT NULL REFERENCES copy_jobs(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source_id TEXT,
+    modified TEXT,
+    md5 TEXT,
+    size TEXT,
+    reused INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS job_source_folders (
+    job_id INTEGER NOT NULL REFERENCES copy_jobs(id) ON DELETE CASCADE,
+    folder_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (job_id, folder_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS job_pending (
+    job_id INTEGER NOT NULL REFERENCES copy_jobs(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    src_id TEXT NOT NULL,
+    dest_parent_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source_id TEXT,
+    modified TEXT,
+    md5 TEXT,
+    size TEXT,
+    PRIMARY KEY (job_id, kind, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rolled_back_tasks (
+    task_id INTEGER PRIMARY KEY
+);
+CREATE INDEX IF NOT EXISTS idx_copied_items_item ON copied_items (item_id);
+CREATE INDEX IF NOT EXISTS idx_job_items_item ON job_items (item_id);
+CREATE INDEX IF NOT EXISTS idx_changes_timestamp ON changes (timestamp);
+CREATE INDEX IF NOT EXISTS idx_changes_operation ON changes (operation, timestamp);
+"""
+
+# Source signature stored with each copied item for delta detection
+SIGNATURE_KEYS = ("source_id", "modified", "md5", "size")
+
+TASK_SUMMARY_COLUMNS = ("id, source_folder_id, dest_folder_id, start_page_token, poll_interval, priority, "
+                        "rollback, copied_count")
+
+CHANGE_COLUMNS = ("timestamp", "operation", "file_name", "file_id",
+                  "source_folder_id", "dest_folder_id", "comment")
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+_rotate_lock = threading.Lock()
+# One lock per monitor task, held while it syncs or is rolled back
+_task_locks = {}
+_task_locks_lock = threading.Lock()
+# Leases held by this process, as (table, id), renewed by _renew_leases
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_leases = set()
+_leases_lock = threading.Lock()
+_renewer = None
+
+class TrackedDict(dict):
+    # dict that remembers which keys were set or removed since it was loaded,
+    # so only those rows have to be written back (copied items use the more
+    # compact copied_map.CopiedMap, which tracks changes the same way)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+        self.removed = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.discard(key)
+        self.removed.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = super().pop(key)
+            self.dirty.discard(key)
+            self.removed.add(key)
+            return value
+        return super().pop(key, *default)
+
+class FolderMap(TrackedDict):
+    # TrackedDict of source folder ID -> relative path that also indexes the
+    # IDs by path (by_path), so the folders below a moved path can be found
+    # without scanning every folder
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.by_path = {path: folder_id for folder_id, path in self.items()}
+
+    def _unindex(self, key):
+        path = self.get(key)
+        if path is not None and self.by_path.get(path) == key:
+            del self.by_path[path]
+
+    def __setitem__(self, key, value):
+        self._unindex(key)
+        super().__setitem__(key, value)
+        self.by_path[value] = key
+
+    def __delitem__(self, key):
+        self._unindex(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        self._unindex(key)
+        return super().pop(key, *default)
+
+def get_connection(db_path: str = STATE_DB_FILE) -> sqlite3.Connection:
+    # sqlite3 connections can't be shared between threads, so keep one per thread
+    connections = _local.__dict__.setdefault("connections", {})
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        connections[db_path] = conn
+        with _init_lock:
+            if db_path not in _initialized:
+                conn.executescript(SCHEMA)
+                _upgrade_schema(conn)
+                migrate_json(conn)
+                _initialized.add(db_path)
+    return conn
+
+def _upgrade_schema(conn: sqlite3.Connection) -> None:
+    # Adds columns introduced after a database was first created
+    added_columns = {
+        "copied_items": [(column, "TEXT") for column in SIGNATURE_KEYS] + [("reused", "INTEGER NOT NULL DEFAULT 0")],
+        "job_items": [(column, "TEXT") for column in SIGNATURE_KEYS] + [("reused", "INTEGER NOT NULL DEFAULT 0")],
+        "job_pending": [(column, "TEXT") for column in SIGNATURE_KEYS],
+        "tasks": [("poll_interval", "REAL"), ("priority", "INTEGER NOT NULL DEFAULT 0"),
+                  ("rollback", "INTEGER NOT NULL DEFAULT 0"), ("copied_count", "INTEGER NOT NULL DEFAULT 0"),
+                  ("lease_owner", "TEXT"), ("lease_until", "REAL")],
+        "copy_jobs": [("lease_owner", "TEXT"), ("lease_until", "REAL")],
+    }
+    for table, columns in added_columns.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                if column == "copied_count":
+                    with conn:
+                        conn.execute("UPDATE tasks SET copied_count = "
+                                     "(SELECT COUNT(*) FROM copied_items c WHERE c.task_id = tasks.id)")
+
+def _load_legacy(filepath: str):
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+def migrate_json(conn: sqlite3.Connection, tasks_file: str = MONITOR_TASKS_FILE,
+                 changes_file: str = CHANGES_LOG_FILE) -> None:
+    # One-shot import of the old JSON files; they are renamed afterwards
+    if os.path.exists(tasks_file):
+        with conn:
+            for task in _load_legacy(tasks_file):
+                task_id = _insert_task(conn, task["source_folder_id"], task["dest_folder_id"],
+                                       task.get("start_page_token"))
+                if task_id is None:
+                    continue
+                _write_copied(conn, task_id, task.get("copied_files", {}))
+                _set_copied_count(conn, task_id, len(task.get("copied_files", {})))
+                _write_source_folders(conn, task_id, task.get("source_folders", {}))
+        os.replace(tasks_file, tasks_file + ".migrated")
+    if os.path.exists(changes_file):
+        with conn:
+            conn.executemany(
+                f"INSERT INTO changes ({', '.join(CHANGE_COLUMNS)}) VALUES ({', '.join('?' * len(CHANGE_COLUMNS))})",
+                [tuple(rec.get(c, "") for c in CHANGE_COLUMNS) for rec in _load_legacy(changes_file)])
+        os.replace(changes_file, changes_file + ".migrated")
+
+def _insert_task(conn, source_id, dest_id, start_page_token=None):
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO tasks (source_folder_id, dest_folder_id, start_page_token) VALUES (?, ?, ?)",
+        (source_id, dest_id, start_page_token))
+    return cur.lastrowid if cur.rowcount else None
+
+def _write_copied(conn, task_id, copied_map, keys=None, table="copied_items", owner="task_id"):
+    if keys is None:
+        entries = copied_map.items()
+    else:
+        entries = ((path, copied_map[path]) for path in keys if path in copied_map)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({owner}, path, item_id, name, {', '.join(SIGNATURE_KEYS)}, reused) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((task_id, path, entry["id"], entry["name"]) + tuple(entry.get(k) for k in SIGNATURE_KEYS)
+         + (int(bool(entry.get("reused"))),) for path, entry in entries))
+    removed = getattr(copied_map, "removed", None)
+    if removed:
+        conn.executemany(f"DELETE FROM {table} WHERE {owner} = ? AND path = ?",
+                         [(task_id, path) for path in removed])
+
+def _set_copied_count(conn, task_id, count):
+    # Kept in the tasks row so task lists don't have to count copied_items
+    conn.execute("UPDATE tasks SET copied_count = ? WHERE id = ?", (count, task_id))
+
+def _write_source_folders(conn, task_id, source_folders, keys=None, table="source_folders", owner="task_id"):
+    if keys is None:
+        keys = source_folders.keys()
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({owner}, folder_id, path) VALUES (?, ?, ?)",
+        [(task_id, folder_id, source_folders[folder_id]) for folder_id in keys])
+
+def _read_copied(conn, owner_id, table="copied_items", owner="task_id") -> CopiedMap:
+    copied_map = CopiedMap()
+    for r in conn.execute(f"SELECT path, item_id, name, {', '.join(SIGNATURE_KEYS)}, reused FROM {table} "
+                          f"WHERE {owner} = ?", (owner_id,)):
+        entry = {"id": r["item_id"], "name": r["name"]}
+        if r["source_id"]:
+            entry.update((k, r[k]) for k in SIGNATURE_KEYS)
+        if r["reused"]:
+            entry["reused"] = True
+        copied_map[r["path"]] = entry
+    copied_map.dirty.clear()
+    return copied_map
+
+def _read_source_folders(conn, owner_id, table="source_folders", owner="task_id") -> FolderMap:
+    source_folders = FolderMap(
+        (r["folder_id"], r["path"])
+        for r in conn.execute(f"SELECT folder_id, path FROM {table} WHERE {owner} = ?", (owner_id,)))
+    source_folders.dirty.clear()
+    return source_folders
+
+def _clear_dirty(*mappings):
+    for mapping in mappings:
+        if isinstance(mapping, (TrackedDict, CopiedMap)):
+            mapping.dirty.clear()
+            mapping.removed.clear()
+
+def add_change_record(operation, file_name, file_id, source_id="", dest_id="", comment=""):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            f"INSERT INTO changes ({', '.join(CHANGE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), operation, file_name, file_id,
+             source_id, dest_id, comment))
+    rotate_change_log(conn)
+
+def rotate_change_log(conn: sqlite3.Connection = None, max_rows: int = CHANGE_LOG_MAX_ROWS,
+                      keep_archives: int = CHANGE_LOG_ARCHIVES) -> int:
+    # Once the table holds twice max_rows, moves all but the newest max_rows
+    # into changes_log.1.jsonl (older archives shift to .2, .3, ...).
+    # Rows are only ever deleted from the head, so ids stay contiguous and
+    # the row count comes from the primary key instead of a full COUNT(*).
+    # The lock keeps this process's threads out of each other's way and the
+    # BEGIN IMMEDIATE write lock does the same for other processes (GUI and
+    # daemon); the count is checked again once both are held.
+    conn = conn or get_connection()
+    first_id, last_id = conn.execute("SELECT MIN(id), MAX(id) FROM changes").fetchone()
+    if first_id is None or last_id - first_id + 1 <= 2 * max_rows:
+        return 0
+    base, _ = os.path.splitext(CHANGES_LOG_FILE)
+    archive = f"{base}.1.jsonl"
+    with _rotate_lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first_id, last_id = conn.execute("SELECT MIN(id), MAX(id) FROM changes").fetchone()
+            if first_id is None or last_id - first_id + 1 <= 2 * max_rows:
+                conn.rollback()
+                return 0
+            cutoff = last_id - max_rows
+            # Written to a temporary file first so a failed rotation leaves no partial archive
+            rows = conn.execute(f"SELECT {', '.join(CHANGE_COLUMNS)} FROM changes WHERE id <= ? ORDER BY id",
+                                (cutoff,))
+            with open(archive + ".tmp", "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+            deleted = conn.execute("DELETE FROM changes WHERE id <= ?", (cutoff,)).rowcount
+            for n in range(keep_archives - 1, 0, -1):
+                older = f"{base}.{n}.jsonl"
+                if os.path.exists(older):
+                    os.replace(older, f"{base}.{n + 1}.jsonl")
+            os.replace(archive + ".tmp", archive)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            if os.path.exists(archive + ".tmp"):
+                os.remove(archive + ".tmp")
+            raise
+    return deleted
+
+def get_change_page(after_id: int = 0, start: str = None, end: str = None, operation: str = None,
+                    limit: int = REPORT_PAGE_SIZE) -> list:
+    # One page of change records in insertion order; pass the last id seen
+    # as after_id to fetch the next page
+    where = ["id > ?"]
+    params = [after_id]
+    if start:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append("timestamp <= ?")
+        params.append(end)
+    if operation:
+        where.append("operation = ?")
+        params.append(operation)
+    params.append(limit)
+    conn = get_connection()
+    rows = conn.execute(
+        f"SELECT id, {', '.join(CHANGE_COLUMNS)} FROM changes WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+        params)
+    return [dict(row) for row in rows]
+
+def get_change_operations() -> list:
+    conn = get_connection()
+    return [row[0] for row in conn.execute("SELECT DISTINCT operation FROM changes ORDER BY operation")]
+
+def add_monitor_task(source_id, dest_id, copied_map=None, sync_state=None):
+    # sync_state: optional {"start_page_token", "source_folders"} from full_sync
+    sync_state = sync_state or {}
+    conn = get_connection()
+    with conn:
+        task_id = _insert_task(conn, source_id, dest_id, sync_state.get("start_page_token"))
+        if task_id is None:
+            return False
+        _write_copied(conn, task_id, copied_map or {})
+        _set_copied_count(conn, task_id, len(copied_map or {}))
+        _write_source_folders(conn, task_id, sync_state.get("source_folders", {}))
+    return True
+
+def remove_monitor_task(source_id, dest_id):
+    # Stops monitoring; the copies are kept. A sync of the task running in
+    # this process is waited for, so it doesn't save into a removed task.
+    conn = get_connection()
+    row = conn.execute("SELECT id FROM tasks WHERE source_folder_id = ? AND dest_folder_id = ?",
+                       (source_id, dest_id)).fetchone()
+    if row is None:
+        return False
+    with task_lock(row["id"]):
+        with conn:
+            cur = conn.execute("DELETE FROM tasks WHERE id = ?", (row["id"],))
+    return cur.rowcount > 0
+
+def clear_monitor_tasks():
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM tasks")
+
+def get_monitor_tasks():
+    # Task summaries only; use load_monitor_task for the copied items
+    conn = get_connection()
+    rows = conn.execute(f"SELECT {TASK_SUMMARY_COLUMNS} FROM tasks ORDER BY priority DESC, id")
+    return [dict(row) for row in rows]
+
+def get_monitor_task(task_id: int) -> dict:
+    # Summary of one task, or None if it no longer exists
+    conn = get_connection()
+    row = conn.execute(f"SELECT {TASK_SUMMARY_COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_monitor_task_page(after_id: int = 0, limit: int = REPORT_PAGE_SIZE) -> list:
+    # Task summaries with id > after_id, for incremental loading in the GUI
+    conn = get_connection()
+    rows = conn.execute(f"SELECT {TASK_SUMMARY_COLUMNS} FROM tasks WHERE id > ? ORDER BY id LIMIT ?",
+                        (after_id, limit))
+    return [dict(row) for row in rows]
+
+def get_monitor_schedules() -> list:
+    # Scheduling settings of every task not being rolled back; poll_interval None means the default
+    conn = get_connection()
+    rows = conn.execute("SELECT id, source_folder_id, dest_folder_id, poll_interval, priority FROM tasks "
+                        "WHERE rollback = 0")
+    return [dict(row) for row in rows]
+
+def set_monitor_schedule(source_id, dest_id, poll_interval=None, priority=0):
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("UPDATE tasks SET poll_interval = ?, priority = ? "
+                           "WHERE source_folder_id = ? AND dest_folder_id = ?",
+                           (poll_interval, priority, source_id, dest_id))
+    return cur.rowcount > 0
+
+def mark_monitor_rollback(task_id: int) -> None:
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE tasks SET rollback = 1 WHERE id = ?", (task_id,))
+
+def get_rollback_tasks() -> list:
+    conn = get_connection()
+    return [row[0] for row in conn.execute("SELECT id FROM tasks WHERE rollback = 1 ORDER BY id")]
+
+def task_lock(task_id: int) -> threading.Lock:
+    with _task_locks_lock:
+        return _task_locks.setdefault(task_id, threading.Lock())
+
+def delete_monitor_task(task_id: int) -> bool:
+    # Removes a rolled back task, but only once it has no copied items left,
+    # so rows saved meanwhile by a sync in another process aren't lost. The
+    # ID is kept in rolled_back_tasks (task IDs are never reused), so such a
+    # sync can tell a rollback from a plain remove_monitor_task.
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("DELETE FROM tasks WHERE id = ? AND NOT EXISTS "
+                           "(SELECT 1 FROM copied_items WHERE task_id = ?)", (task_id, task_id))
+        if cur.rowcount:
+            conn.execute("INSERT OR IGNORE INTO rolled_back_tasks (task_id) VALUES (?)", (task_id,))
+    return cur.rowcount > 0 or get_monitor_task(task_id) is None
+
+def shared_item_ids(task_id: int, item_ids: list) -> set:
+    # The given IDs that other tasks or copy jobs also recorded, e.g. a
+    # destination folder one task created and another reused
+    conn = get_connection()
+    shared = set()
+    for i in range(0, len(item_ids), 500):
+        chunk = item_ids[i:i + 500]
+        marks = ", ".join("?" * len(chunk))
+        shared.update(row[0] for row in conn.execute(
+            f"SELECT item_id FROM copied_items WHERE item_id IN ({marks}) AND task_id != ? "
+            f"UNION SELECT item_id FROM job_items WHERE item_id IN ({marks})", chunk + [task_id] + chunk))
+    return shared
+
+def take_lease(table: str, row_id: int) -> bool:
+    # Claims a task ("tasks") or copy job ("copy_jobs") for this process
+    # unless another process holds an unexpired lease on it. The lease is
+    # renewed until release_lease, and expires if the process dies.
+    global _renewer
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(f"UPDATE {table} SET lease_owner = ?, lease_until = ? "
+                           f"WHERE id = ? AND (lease_until IS NULL OR lease_until < ?)",
+                           (LEASE_OWNER, now + LEASE_SECONDS, row_id, now))
+    if not cur.rowcount:
+        return False
+    with _leases_lock:
+        _leases.add((table, row_id))
+        if _renewer is None:
+            _renewer = threading.Thread(target=_renew_leases, daemon=True)
+            _renewer.start()
+    return True
+
+def release_lease(table: str, row_id: int) -> None:
+    with _leases_lock:
+        _leases.discard((table, row_id))
+    conn = get_connection()
+    with conn:
+        conn.execute(f"UPDATE {table} SET lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ?",
+                     (row_id, LEASE_OWNER))
+
+def _renew_leases():
+    while True:
+        time.sleep(LEASE_SECONDS / 3)
+        with _leases_lock:
+            held = list(_leases)
+        if not held:
+            continue
+        try:
+            conn = get_connection()
+            until = time.time() + LEASE_SECONDS
+            with conn:
+                for table in {table for table, _ in held}:
+                    conn.executemany(f"UPDATE {table} SET lease_until = ? WHERE id = ? AND lease_owner = ?",
+                                     [(until, row_id, LEASE_OWNER) for t, row_id in held if t == table])
+        except sqlite3.Error:
+            # Retried on the next round, well before the leases expire
+            pass
+
+def was_rolled_back(task_id: int) -> bool:
+    conn = get_connection()
+    return conn.execute("SELECT 1 FROM rolled_back_tasks WHERE task_id = ?", (task_id,)).fetchone() is not None
+
+def load_monitor_task(task_id: int) -> dict:
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    if row is None:
+        return None
+    task = dict(row)
+    task["copied_files"] = _read_copied(conn, task_id)
+    source_folders = _read_source_folders(conn, task_id)
+    # Tasks created before the changes feed have no folder map yet
+    if source_folders or task["start_page_token"]:
+        task["source_folders"] = source_folders
+    return task
+
+def save_monitor_task(task: dict) -> None:
+    # Writes back the token and only the copied items/folders added since loading
+    conn = get_connection()
+    copied_map = task.get("copied_files", {})
+    source_folders = task.get("source_folders", {})
+    with conn:
+        conn.execute("UPDATE tasks SET start_page_token = ? WHERE id = ?",
+                     (task.get("start_page_token"), task["id"]))
+        _write_copied(conn, task["id"], copied_map, getattr(copied_map, "dirty", None))
+        _set_copied_count(conn, task["id"], len(copied_map))
+        _write_source_folders(conn, task["id"], source_folders, getattr(source_folders, "dirty", None))
+    _clear_dirty(copied_map, source_folders)
+
+def create_copy_job(kind: str, source_id: str, dest_id: str, start_page_token: str = None) -> int:
+    # A new job starts with the source root as its only pending folder
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO copy_jobs (kind, source_folder_id, dest_folder_id, start_page_token, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (kind, source_id, dest_id, start_page_token, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        job_id = cur.lastrowid
+        conn.execute("INSERT INTO job_pending (job_id, kind, src_id, dest_parent_id, path, name) "
+                     "VALUES (?, 'folder', ?, ?, '', '')", (job_id, source_id, dest_id))
+    return job_id
+
+def get_copy_jobs() -> list:
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT j.*, (SELECT COUNT(*) FROM job_items i WHERE i.job_id = j.id) AS copied_count
+        FROM copy_jobs j ORDER BY j.id
+    """)
+    return [dict(row) for row in rows]
+
+def load_copy_job(job_id: int) -> dict:
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM copy_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["copied_files"] = _read_copied(conn, job_id, "job_items", "job_id")
+    job["source_folders"] = _read_source_folders(conn, job_id, "job_source_folders", "job_id")
+    job["pending_folders"] = []
+    job["pending_files"] = []
+    for r in conn.execute(f"SELECT kind, src_id, dest_parent_id, path, name, {', '.join(SIGNATURE_KEYS)} "
+                          f"FROM job_pending WHERE job_id = ?", (job_id,)):
+        if r["kind"] == "folder":
+            job["pending_folders"].append((r["src_id"], r["dest_parent_id"], r["path"]))
+        else:
+            # Files queued before signatures were stored get none, as in _read_copied
+            signature = {k: r[k] for k in SIGNATURE_KEYS} if r["source_id"] else {}
+            job["pending_files"].append((r["src_id"], r["name"], r["dest_parent_id"], r["path"], signature))
+    return job
+
+def checkpoint_copy_job(job: dict, pending_folders: list = None, new_files: list = None) -> None:
+    # Flushes copied items added since the last checkpoint. pending_folders,
+    # if given, replaces the folder queue; new_files are added to the file queue.
+    conn = get_connection()
+    copied_map = job["copied_files"]
+    source_folders = job["source_folders"]
+    with conn:
+        _write_copied(conn, job["id"], copied_map, getattr(copied_map, "dirty", None), "job_items", "job_id")
+        _write_source_folders(conn, job["id"], source_folders, getattr(source_folders, "dirty", None),
+                              "job_source_folders", "job_id")
+        if pending_folders is not None:
+            conn.execute("DELETE FROM job_pending WHERE job_id = ? AND kind = 'folder'", (job["id"],))
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_pending (job_id, kind, src_id, dest_parent_id, path, name) "
+                "VALUES (?, 'folder', ?, ?, ?, '')",
+                [(job["id"], src, dest, path) for (src, dest, path) in pending_folders])
+        if new_files:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO job_pending (job_id, kind, src_id, dest_parent_id, path, name, "
+                f"{', '.join(SIGNATURE_KEYS)}) VALUES (?, 'file', ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job["id"], fid, parent, path, name) + tuple(signature.get(k) for k in SIGNATURE_KEYS)
+                 for (fid, name, parent, path, signature) in new_files])
+    _clear_dirty(copied_map, source_folders)
+
+def delete_copy_job(job_id: int) -> None:
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM copy_jobs WHERE id = ?", (job_id,))